@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Offline throughput benchmark of the API callers against local mock servers.
+"""
+
+from lib.benchmark import MockServer, run_benchmark, format_report
+
+if __name__ == '__main__':
+
+## Mock server, tune to resemble the APIs and image hosts of interest
+    server = MockServer(total_results = 100,    # Results per query before it is exhausted
+                        api_latency = 0.2,      # Seconds per search request
+                        image_latency = 0.1,    # Seconds per image request
+                        error_rate = 0.05,      # Fraction of requests that fail
+                        error_status = 404,     # 5xx statuses also exercise the retry backoff
+                        image_size = (640, 480))
+
+## Benchmark
+    caller_args = {'fetch_workers': 8, 'decode_workers': 2, 'write_workers': 2}
+    queries = [f'benchmark query {i}' for i in range(5)]
+    measurements = run_benchmark(providers = ['google', 'bing', 'flickr'], queries = queries, pages = 3,
+                                 caller_args = caller_args, server = server)
+    server.stop()
+    print(format_report(measurements))
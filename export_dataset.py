@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Packs the images labelled with ImageCleaner into shards for training data loaders.
+"""
+
+from lib.dataset_export import export_shards
+from lib.data_utils import ImgDatabaseHandler
+
+if __name__ == '__main__':
+
+## Labelled images
+    DATA_ROOT = '/media/alex/A4A034E0A034BB1E/incidents-thesis/data'
+    target_table = 'flooding'
+    db_handler = ImgDatabaseHandler(DATA_ROOT)
+    if not hasattr(db_handler, 'get_image_details'): # Reads (class, path, geo, time) rows of a table
+        raise SystemExit("ImgDatabaseHandler has no get_image_details(table), cannot read the labelled images")
+    samples = [{'path': path.lstrip('/'), 'label': img_class, 'geo': geo, 'time': time}
+               for img_class, path, geo, time in db_handler.get_image_details(target_table)]
+
+## Export
+    index = export_shards(samples, DATA_ROOT, f'{DATA_ROOT}/shards/{target_table}',
+                          shard_size = 10000,   # Samples per shard
+                          max_side = 512,       # Downscale for training, None to pack the originals
+                          processes = None)     # Shards written at once, defaults to the number of CPUs
+    print(f"Exported {index['samples']} images in {len(index['shards'])} shards")
@@ -0,0 +1,324 @@
+import io
+import json
+import multiprocessing
+import queue
+import random
+import resource
+import shutil
+import tempfile
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image
+
+# Stand-in endpoints, appended to the mock server URL as the rest_url of each caller
+API_PATHS = {'google': '/google/customsearch/v1',
+             'bing': '/bing/images/search',
+             'flickr': '/flickr/services/rest/?'}
+
+
+def synthetic_jpeg(width, height, seed=0):
+    """Encodes a noisy JPEG, which compresses about as poorly as a photo does.
+
+    Args:
+        width (int): Image width in pixels.
+        height (int): Image height in pixels.
+        seed (int): Seed of the noise, so payloads are reproducible.
+
+    Returns:
+        The encoded JPEG bytes.
+    """
+    rng = random.Random(seed)
+    img = Image.frombytes('RGB', (width, height), rng.randbytes(width * height * 3))
+    with io.BytesIO() as out:
+        img.save(out, 'JPEG', quality=85)
+        return out.getvalue()
+
+
+class MockServer():
+    """Local stand-in for the Google, Bing and Flickr search APIs and for the image hosts.
+
+    Search responses are shaped like the parts of the real responses that the callers parse, and
+    every result links to a synthetic image on the same server. Latency, error rate and payload size
+    are configurable, so runs are reproducible without API keys or network access.
+    """
+    def __init__(self, total_results=100, api_latency=0.05, image_latency=0.02, error_rate=0.0,
+                 error_status=404, image_size=(640, 480), variants=8, flickr_extras=True, seed=0):
+        """
+        Args:
+            total_results (int): Number of results every query has before it is exhausted.
+            api_latency (float): Seconds every search request takes.
+            image_latency (float): Seconds every image request takes.
+            error_rate (float): Fraction of requests answered with error_status.
+            error_status (int): Status of failed requests. 5xx statuses exercise the retry backoff.
+            image_size (tuple of ints): Width and height of the synthetic images.
+            variants (int): Number of distinct image payloads, served round-robin.
+            flickr_extras (bool): Include the image URLs in Flickr search results. Without them the
+                caller looks up every photo with getSizes.
+            seed (int): Seed of the payloads and the injected errors.
+        """
+        self.total_results = total_results
+        self.api_latency = api_latency
+        self.image_latency = image_latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.flickr_extras = flickr_extras
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.payloads = [synthetic_jpeg(*image_size, seed=seed + i) for i in range(variants)]
+        self.requests = 0
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler_class())
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+        self.thread = None
+
+    def start(self):
+        """Serves requests in a background thread.
+
+        Returns:
+            The server, so it can be started inline.
+        """
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stops serving and closes the socket."""
+        self.server.shutdown()
+        self.server.server_close()
+
+    def rest_url(self, provider):
+        """Gets the URL replacing the API URL of a caller.
+
+        Args:
+            provider (string): Source name of the caller.
+
+        Returns:
+            The stand-in endpoint.
+        """
+        return self.url + API_PATHS[provider]
+
+    def _handler_class(self):
+        """Binds a request handler class to this server."""
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1' # Keep-alive, like the real APIs
+
+            def do_GET(self):
+                mock._handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def _failed(self):
+        """Draws whether the current request fails."""
+        with self.rng_lock:
+            self.requests += 1
+            return self.rng.random() < self.error_rate
+
+    def _handle(self, request):
+        """Answers a single request.
+
+        Args:
+            request (BaseHTTPRequestHandler): The request being handled.
+        """
+        url = urllib.parse.urlsplit(request.path)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        is_image = url.path.startswith('/images/')
+        time.sleep(self.image_latency if is_image else self.api_latency)
+
+        if self._failed():
+            self._send(request, self.error_status, b'', 'text/plain')
+        elif is_image:
+            image_id = int(url.path.rsplit('/', 1)[-1].split('.')[0])
+            self._send(request, 200, self.payloads[image_id % len(self.payloads)], 'image/jpeg')
+        elif url.path == API_PATHS['google']:
+            self._send_json(request, self._google(params))
+        elif url.path == API_PATHS['bing']:
+            self._send_json(request, self._bing(params))
+        elif url.path == API_PATHS['flickr'].rstrip('?'):
+            if params.get('method') == 'flickr.photos.getSizes':
+                self._send_json(request, self._flickr_sizes(params))
+            else:
+                self._send_json(request, self._flickr_search(params))
+        else:
+            self._send(request, 404, b'', 'text/plain')
+
+    def _image_ids(self, query, offset, count):
+        """Picks the result IDs of a page, distinct per query so results are not duplicates.
+
+        Args:
+            query (string): Image search query.
+            offset (int): Index of the first result.
+            count (int): Number of results requested.
+
+        Returns:
+            The range of result IDs.
+        """
+        base = (sum(query.encode('utf-8')) % 1000) * 100000
+        return range(base + offset, base + min(offset + count, self.total_results))
+
+    def _image_url(self, image_id):
+        return f'{self.url}/images/{image_id}.jpg'
+
+    def _google(self, params):
+        offset = max(int(params.get('start', 1)) - 1, 0) # start is 1-based
+        count = int(params.get('num', 10))
+        ids = self._image_ids(params.get('q', ''), offset, count)
+        response = {'queries': {'request': [{'startIndex': offset + 1}]}}
+        if len(ids):
+            response['items'] = [{'link': self._image_url(i)} for i in ids]
+        if offset + count < self.total_results:
+            response['queries']['nextPage'] = [{'startIndex': offset + count + 1}]
+        return response
+
+    def _bing(self, params):
+        offset = int(params.get('offset', 0))
+        ids = self._image_ids(params.get('q', ''), offset, int(params.get('count', 35)))
+        return {'value': [{'imageId': str(i), 'contentUrl': self._image_url(i)} for i in ids],
+                'totalEstimatedMatches': self.total_results,
+                'nextOffset': offset + len(ids)}
+
+    def _flickr_search(self, params):
+        per_page = int(params.get('per_page', 100))
+        page = int(params.get('page', 1))
+        ids = self._image_ids(params.get('text', ''), (page - 1) * per_page, per_page)
+        with_extras = self.flickr_extras and 'extras' in params
+        photos = []
+        for i in ids:
+            photo = {'id': str(i)}
+            if with_extras:
+                photo.update({'can_download': 1, 'url_m': self._image_url(i)})
+            photos.append(photo)
+        return {'photos': {'page': page, 'pages': -(-self.total_results // per_page), 'photo': photos},
+                'stat': 'ok'}
+
+    def _flickr_sizes(self, params):
+        return {'sizes': {'candownload': 1, 'size': [{'source': self._image_url(int(params['photo_id']))}]},
+                'stat': 'ok'}
+
+    def _send_json(self, request, response):
+        self._send(request, 200, json.dumps(response).encode('utf-8'), 'application/json')
+
+    def _send(self, request, status, body, content_type):
+        request.send_response(status)
+        request.send_header('Content-Type', content_type)
+        request.send_header('Content-Length', str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
+
+
+def _make_caller(provider, rest_url, data_root, images_per_req, caller_args):
+    """Creates an API caller pointed at a stand-in endpoint."""
+    from data_management.scraper import GoogleCaller, BingCaller, FlickrCaller
+    from data_management.metrics import Metrics
+
+    caller_args = dict(caller_args, metrics=Metrics())
+    if provider == 'google':
+        caller = GoogleCaller('benchmark', data_root, images_per_req, cx='benchmark', **caller_args)
+    elif provider == 'bing':
+        caller = BingCaller('benchmark', data_root, images_per_req, **caller_args)
+    else:
+        caller = FlickrCaller('benchmark', data_root, images_per_req, **caller_args)
+    caller.rest_url = rest_url
+    return caller
+
+def _run_caller(provider, rest_url, queries, pages, images_per_req, caller_args, results):
+    """Runs all queries through one caller. Target of the benchmark worker processes.
+
+    Args:
+        provider (string): Source name of the caller.
+        rest_url (string): The stand-in endpoint.
+        queries (list of strings): Image search queries.
+        pages (int): Result pages per query.
+        images_per_req (int): Results per search request.
+        caller_args (dict): Extra keyword arguments of the caller, e.g. fetch_workers.
+        results (multiprocessing.Queue): Receives the measurements.
+    """
+    data_root = tempfile.mkdtemp(prefix=f'benchmark_{provider}_')
+    try:
+        caller = _make_caller(provider, rest_url, data_root, images_per_req, caller_args)
+        start = time.perf_counter()
+        saved = sum(caller.download_pages(query, 'benchmark', pages) for query in queries)
+        elapsed = time.perf_counter() - start
+    finally:
+        shutil.rmtree(data_root, ignore_errors=True)
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN) # Image normalizer processes
+    results.put({'provider': provider,
+                 'images': saved,
+                 'seconds': elapsed,
+                 'images_per_second': saved / elapsed if elapsed > 0 else 0.0,
+                 'cpu_seconds': usage.ru_utime + usage.ru_stime + children.ru_utime + children.ru_stime,
+                 'peak_rss_mb': usage.ru_maxrss / 1024, # ru_maxrss is in KiB on Linux
+                 'metrics': caller.metrics.snapshot()})
+
+def _wait_for_result(process, results):
+    """Waits for the measurements of a worker process, failing if it dies without any."""
+    while True:
+        try:
+            return results.get(timeout=1)
+        except queue.Empty:
+            if not process.is_alive():
+                raise RuntimeError(f"Benchmark process exited with code {process.exitcode}")
+
+def run_benchmark(providers=('google', 'bing', 'flickr'), queries=None, pages=3, images_per_req=None,
+                  caller_args=None, server=None):
+    """Benchmarks the callers against a local mock server.
+
+    Every caller runs in a fresh process, so its CPU time and peak RSS are measured in isolation
+    and are not inflated by the mock server or by earlier callers.
+
+    Args:
+        providers (list of strings): Callers to benchmark.
+        queries (list of strings): Image search queries, defaults to five synthetic queries.
+        pages (int): Result pages per query.
+        images_per_req (dict): Results per search request per provider, defaults to the API maxima.
+        caller_args (dict): Extra keyword arguments for every caller, e.g. fetch_workers.
+        server (MockServer): Server to run against, a default server is started if None.
+
+    Returns:
+        A list with the measurements of every caller.
+    """
+    queries = queries or [f'benchmark query {i}' for i in range(5)]
+    images_per_req = dict({'google': 10, 'bing': 35, 'flickr': 100}, **(images_per_req or {}))
+    own_server = server is None
+    server = (server or MockServer()).start()
+
+    ctx = multiprocessing.get_context('spawn')
+    results = ctx.Queue()
+    measurements = []
+    try:
+        for provider in providers:
+            process = ctx.Process(target=_run_caller,
+                                  args=(provider, server.rest_url(provider), queries, pages,
+                                        images_per_req[provider], caller_args or {}, results))
+            process.start()
+            measurements.append(_wait_for_result(process, results))
+            process.join()
+    finally:
+        if own_server:
+            server.stop()
+    return measurements
+
+def format_report(measurements):
+    """Formats benchmark measurements as a table.
+
+    Args:
+        measurements (list of dicts): Output of run_benchmark.
+
+    Returns:
+        The report as a string.
+    """
+    lines = [f"{'provider':<10}{'images':>8}{'seconds':>10}{'images/s':>10}{'cpu s':>8}{'rss MB':>8}"]
+    for m in measurements:
+        lines.append(f"{m['provider']:<10}{m['images']:>8}{m['seconds']:>10.2f}{m['images_per_second']:>10.1f}"
+                     f"{m['cpu_seconds']:>8.2f}{m['peak_rss_mb']:>8.1f}")
+    return '\n'.join(lines)
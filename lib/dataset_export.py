@@ -0,0 +1,151 @@
+import io
+import json
+import mmap
+import os
+import tarfile
+from concurrent.futures import ProcessPoolExecutor
+
+from data_management.img_normalize import normalize_image_bytes
+
+INDEX_FILE = 'index.json'
+
+
+def _shard_name(shard):
+    return f'shard-{shard:05d}'
+
+def _add_member(tar, name, data):
+    """Appends a file to a tar archive.
+
+    Returns:
+        (offset, size) of the file contents within the archive.
+    """
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    tar.addfile(info, io.BytesIO(data))
+    padded_size = -(-len(data) // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+    return tar.offset - padded_size, len(data) # The contents end the archive so far
+
+def write_shard(shard, samples, root_dir, out_dir, max_side=None, quality=90):
+    """Packs samples into a single uncompressed tar shard with an offset index.
+
+    Every sample is stored WebDataset-style as <key>.jpg and <key>.json. The index lists the offset
+    and size of both, so readers can slice them straight out of the memory-mapped shard.
+
+    Args:
+        shard (int): Shard number.
+        samples (list of dicts): Samples with the image 'path' relative to root_dir, its 'label' and
+            any further JSON-serializable metadata.
+        root_dir (string): The corpus root.
+        out_dir (string): Output directory of the shards.
+        max_side (int): Downscale images to this longest side and re-encode them, None to pack the
+            stored files as they are.
+        quality (int): JPEG quality used when re-encoding.
+
+    Returns:
+        A dict with the shard 'name', its number of 'samples' and the 'skipped' unreadable images.
+    """
+    name = _shard_name(shard)
+    tmp_path = os.path.join(out_dir, f'{name}.tar.tmp')
+    entries = []
+    skipped = 0
+    with tarfile.open(tmp_path, 'w', format=tarfile.USTAR_FORMAT) as tar:
+        for position, sample in enumerate(samples):
+            try:
+                with open(os.path.join(root_dir, sample['path']), 'rb') as f:
+                    image = f.read()
+                if max_side:
+                    image = normalize_image_bytes(image, max_side=max_side, quality=quality)
+            except Exception as e:
+                print(f"Skipping unreadable image: {sample['path']}\n{str(e)}\n")
+                skipped += 1
+                continue
+            key = f'{shard:05d}{position:06d}'
+            image_offset, image_size = _add_member(tar, f'{key}.jpg', image)
+            meta_offset, meta_size = _add_member(tar, f'{key}.json', json.dumps(sample).encode('utf-8'))
+            entries.append([key, image_offset, image_size, meta_offset, meta_size])
+    os.replace(tmp_path, os.path.join(out_dir, f'{name}.tar'))
+    with open(os.path.join(out_dir, f'{name}.idx.json'), 'w') as f:
+        json.dump(entries, f)
+    return {'name': name, 'samples': len(entries), 'skipped': skipped}
+
+def export_shards(samples, root_dir, out_dir, shard_size=10000, max_side=None, quality=90, processes=None):
+    """Exports labelled images as fixed-size shards, written in parallel.
+
+    Args:
+        samples (list of dicts): Samples with the image 'path' relative to root_dir, its 'label' and
+            any further JSON-serializable metadata.
+        root_dir (string): The corpus root.
+        out_dir (string): Output directory, created if it does not exist.
+        shard_size (int): Number of samples per shard.
+        max_side (int): Downscale images to this longest side and re-encode them, None to pack the
+            stored files as they are.
+        quality (int): JPEG quality used when re-encoding.
+        processes (int): Number of shards written at once, defaults to the number of CPUs.
+
+    Returns:
+        The dataset index, also written to index.json in out_dir.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    samples = list(samples)
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = [pool.submit(write_shard, shard, samples[start:start + shard_size], root_dir, out_dir,
+                               max_side, quality)
+                   for shard, start in enumerate(range(0, len(samples), shard_size))]
+        shards = [future.result() for future in futures]
+    index = {'shards': shards, 'samples': sum(shard['samples'] for shard in shards)}
+    with open(os.path.join(out_dir, INDEX_FILE), 'w') as f:
+        json.dump(index, f, indent=2)
+    return index
+
+
+class ShardReader():
+    """Reads exported shards through memory maps.
+
+    Images are returned as memoryviews into the mapped shard, without copying them. They stay valid
+    until the reader is closed; copy them with bytes() to keep them longer.
+    """
+    def __init__(self, out_dir):
+        """
+        Args:
+            out_dir (string): Directory holding the shards and index.json.
+        """
+        self.out_dir = out_dir
+        with open(os.path.join(out_dir, INDEX_FILE)) as f:
+            self.index = json.load(f)
+        self.entries = []
+        self.maps = []
+        for shard, info in enumerate(self.index['shards']):
+            with open(os.path.join(out_dir, f"{info['name']}.idx.json")) as f:
+                self.entries += [(shard, *entry) for entry in json.load(f)]
+            with open(os.path.join(out_dir, f"{info['name']}.tar"), 'rb') as f:
+                shard_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) # Tar files are never empty
+            if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                shard_map.madvise(mmap.MADV_SEQUENTIAL)
+            self.maps.append(shard_map)
+        self.views = [memoryview(shard_map) for shard_map in self.maps]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getitem__(self, i):
+        """Gets a sample by its position in the dataset.
+
+        Returns:
+            (image bytes as a memoryview, metadata dict) tuple.
+        """
+        shard, key, image_offset, image_size, meta_offset, meta_size = self.entries[i]
+        view = self.views[shard]
+        return (view[image_offset:image_offset + image_size],
+                json.loads(bytes(view[meta_offset:meta_offset + meta_size])))
+
+    def __iter__(self):
+        """Yields all samples in storage order, so every shard is read sequentially."""
+        for i in range(len(self)):
+            yield self[i]
+
+    def close(self):
+        """Releases the memory maps. Views handed out before must be released first."""
+        for view in self.views:
+            view.release()
+        for shard_map in self.maps:
+            shard_map.close()
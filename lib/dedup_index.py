@@ -0,0 +1,139 @@
+import hashlib
+import sqlite3
+import threading
+
+
+def content_hash(image_bytes):
+    """Computes the content address of a downloaded payload.
+
+    Args:
+        image_bytes (bytes): The raw downloaded bytes.
+
+    Returns:
+        The hex SHA-256 digest of the payload.
+    """
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+class DedupIndex():
+    """Persistent index of downloaded images, keyed by content hash and by source URL.
+
+    The URL index is consulted before fetching, so a URL is only ever downloaded once. The content
+    index makes sure byte-identical payloads from different URLs are stored once. Every
+    (provider, query) that returned an image is kept as a hit on its content hash.
+    """
+    def __init__(self, db_path):
+        """
+        Args:
+            db_path (string): Path of the SQLite database file, created if it does not exist.
+        """
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS content (
+                hash TEXT PRIMARY KEY,
+                path TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS urls (
+                url TEXT PRIMARY KEY,
+                hash TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS hits (
+                hash TEXT NOT NULL,
+                provider TEXT NOT NULL,
+                query TEXT NOT NULL,
+                url TEXT NOT NULL,
+                UNIQUE (hash, provider, query, url)
+            );
+            CREATE INDEX IF NOT EXISTS hits_hash ON hits (hash);
+        ''')
+        self.conn.commit()
+
+    def seen_url(self, url):
+        """Looks up whether a URL has been downloaded before.
+
+        Args:
+            url (string): The image source URL.
+
+        Returns:
+            The content hash stored for the URL, or None if it is unknown.
+        """
+        with self.lock:
+            row = self.conn.execute('SELECT hash FROM urls WHERE url = ?', (url,)).fetchone()
+        return row[0] if row else None
+
+    def stored_path(self, image_hash):
+        """Looks up where the payload with a given hash was saved.
+
+        Args:
+            image_hash (string): The content hash.
+
+        Returns:
+            The output path of the stored copy, or None if it is unknown.
+        """
+        with self.lock:
+            row = self.conn.execute('SELECT path FROM content WHERE hash = ?', (image_hash,)).fetchone()
+        return row[0] if row else None
+
+    def claim(self, image_hash, path):
+        """Reserves a content hash for a new file.
+
+        Args:
+            image_hash (string): The content hash of the payload.
+            path (string): Output path the payload will be saved to.
+
+        Returns:
+            True if the hash was new and the caller should save the payload, False if another copy
+            is already stored.
+        """
+        with self.lock:
+            cursor = self.conn.execute('INSERT OR IGNORE INTO content (hash, path) VALUES (?, ?)',
+                                       (image_hash, path))
+            self.conn.commit()
+        return cursor.rowcount == 1
+
+    def release(self, image_hash):
+        """Drops a claim for a payload that could not be saved after all.
+
+        Args:
+            image_hash (string): The content hash claimed before.
+        """
+        with self.lock:
+            self.conn.execute('DELETE FROM content WHERE hash = ?', (image_hash,))
+            self.conn.commit()
+
+    def add_hit(self, image_hash, url, provider, query):
+        """Records that a provider returned a payload for a query.
+
+        Args:
+            image_hash (string): The content hash of the payload.
+            url (string): The image source URL.
+            provider (string): Name of the API the result came from.
+            query (string): The search query that returned the result.
+        """
+        with self.lock:
+            self.conn.execute('INSERT OR IGNORE INTO urls (url, hash) VALUES (?, ?)', (url, image_hash))
+            self.conn.execute('INSERT OR IGNORE INTO hits (hash, provider, query, url) VALUES (?, ?, ?, ?)',
+                              (image_hash, provider, query, url))
+            self.conn.commit()
+
+    def hits(self, image_hash):
+        """Lists every search hit recorded for a payload.
+
+        Args:
+            image_hash (string): The content hash.
+
+        Returns:
+            A list of (provider, query, url) tuples.
+        """
+        with self.lock:
+            return self.conn.execute('SELECT provider, query, url FROM hits WHERE hash = ?',
+                                     (image_hash,)).fetchall()
+
+    def close(self):
+        """Closes the database connection."""
+        with self.lock:
+            self.conn.close()
@@ -1,12 +1,23 @@
+import struct
+
+import numpy as np
 from PIL import Image
 from PIL.ExifTags import TAGS, GPSTAGS
 
+EXIF_IFD = 0x8769
+GPS_IFD = 0x8825
+TAG_MAKE = 0x010F
+TAG_MODEL = 0x0110
+TAG_DATETIME = 0x0132
+TAG_DATETIME_ORIGINAL = 0x9003
+GPS_LATITUDE_REF, GPS_LATITUDE, GPS_LONGITUDE_REF, GPS_LONGITUDE = 1, 2, 3, 4
+
 def get_exif_if_exists(image):
-    img = Image.open(image)
-    if img.format in ['JPEG', 'TIFF']:
-        exif = img._getexif()
-        decoded_exif = decode_tags(exif)
-        return decoded_exif
+    with Image.open(image) as img:
+        if img.format in ['JPEG', 'TIFF']:
+            exif = img._getexif()
+            decoded_exif = decode_tags(exif)
+            return decoded_exif
 
 def decode_tags(exif):
     tagged_exif = {}
@@ -27,3 +38,117 @@ def decode_geo(exif_dict):
                 gps_data[sub_decoded] = exif_dict['GPSInfo'][tag]
             exif_dict['GPSInfo'] = gps_data
     return exif_dict
+
+def read_exif_segment(image_path):
+    """Reads the EXIF segment of a JPEG by walking its marker segments.
+
+    Only the segment headers in front of the EXIF data are read, the image data is never touched.
+
+    Args:
+        image_path (string): Path of the image file.
+
+    Returns:
+        The APP1 payload starting with the Exif identifier, an empty bytes object if the JPEG has no
+        EXIF data, or None if the file is not a JPEG.
+    """
+    with open(image_path, 'rb') as f:
+        if f.read(2) != b'\xff\xd8':
+            return None
+        while True:
+            marker = f.read(2)
+            if len(marker) < 2 or marker[0] != 0xFF:
+                return b''
+            if marker[1] == 0xFF: # Fill byte, the marker starts one byte later
+                f.seek(-1, 1)
+                continue
+            if marker[1] in (0xD9, 0xDA): # End of image or start of scan, no EXIF in the header
+                return b''
+            if marker[1] == 0x01 or 0xD0 <= marker[1] <= 0xD7: # Markers without a length
+                continue
+            header = f.read(2)
+            if len(header) < 2:
+                return b''
+            length = struct.unpack('>H', header)[0]
+            if marker[1] == 0xE1:
+                data = f.read(length - 2)
+                if data.startswith(b'Exif\x00\x00'):
+                    return data
+            else:
+                f.seek(length - 2, 1)
+
+def read_exif(image_path):
+    """Parses the EXIF tags of an image without initializing the image itself.
+
+    JPEGs are parsed from their EXIF segment alone. Other formats, e.g. TIFF, fall back to PIL, which
+    only reads their header.
+
+    Args:
+        image_path (string): Path of the image file.
+
+    Returns:
+        A PIL Image.Exif mapping, empty if the image has no EXIF data.
+    """
+    segment = read_exif_segment(image_path)
+    if segment is not None:
+        exif = Image.Exif()
+        if segment:
+            exif.load(segment)
+        return exif
+    with Image.open(image_path) as img:
+        exif = img.getexif()
+        exif.get_ifd(EXIF_IFD) # Sub-IFDs are read lazily from the file, so load them while it is open
+        exif.get_ifd(GPS_IFD)
+    return exif
+
+def _rationals(value):
+    """Converts a degrees/minutes/seconds GPS value to three floats."""
+    try:
+        return tuple(float(part) for part in value) if len(value) == 3 else None
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+
+def extract_metadata(image_path):
+    """Extracts the timestamp, camera and raw GPS coordinates of an image.
+
+    Args:
+        image_path (string): Path of the image file.
+
+    Returns:
+        A dict with 'timestamp', 'make' and 'model' strings (empty if missing), and 'gps_lat' and
+        'gps_lon' as (degrees, minutes, seconds) tuples (None if missing) with their 'gps_lat_ref'
+        and 'gps_lon_ref'. Unreadable images give an empty record.
+    """
+    record = {'timestamp': '', 'make': '', 'model': '',
+              'gps_lat': None, 'gps_lat_ref': '', 'gps_lon': None, 'gps_lon_ref': ''}
+    try:
+        exif = read_exif(image_path)
+        exif_ifd = exif.get_ifd(EXIF_IFD)
+        gps_ifd = exif.get_ifd(GPS_IFD)
+    except Exception:
+        return record
+
+    text = lambda value: str(value).strip('\x00 ') if value is not None else ''
+    record['timestamp'] = text(exif_ifd.get(TAG_DATETIME_ORIGINAL) or exif.get(TAG_DATETIME))
+    record['make'] = text(exif.get(TAG_MAKE))
+    record['model'] = text(exif.get(TAG_MODEL))
+    if GPS_LATITUDE in gps_ifd and GPS_LONGITUDE in gps_ifd:
+        record['gps_lat'] = _rationals(gps_ifd[GPS_LATITUDE])
+        record['gps_lon'] = _rationals(gps_ifd[GPS_LONGITUDE])
+        record['gps_lat_ref'] = text(gps_ifd.get(GPS_LATITUDE_REF))[:1]
+        record['gps_lon_ref'] = text(gps_ifd.get(GPS_LONGITUDE_REF))[:1]
+    return record
+
+def gps_to_decimal(dms, refs):
+    """Converts a batch of degrees/minutes/seconds GPS values to signed decimal degrees.
+
+    Args:
+        dms (array-like): (N, 3) degrees, minutes and seconds, NaN rows for missing coordinates.
+        refs (array-like): N hemisphere references, 'S' and 'W' give negative coordinates.
+
+    Returns:
+        An array of N decimal degrees, NaN where the input is missing.
+    """
+    dms = np.asarray(dms, dtype=float).reshape(-1, 3)
+    decimal = dms[:, 0] + dms[:, 1] / 60 + dms[:, 2] / 3600
+    negative = np.isin(np.char.upper(np.asarray(refs, dtype=str)), ['S', 'W'])
+    return np.where(negative, -decimal, decimal)
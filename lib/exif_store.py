@@ -0,0 +1,158 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from data_management import exif_functions
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.tif', '.tiff')
+TEXT_COLUMNS = ['path', 'timestamp', 'make', 'model', 'gps_lat_ref', 'gps_lon_ref']
+GPS_COLUMNS = ['gps_lat', 'gps_lon'] # (N, 3) degrees, minutes, seconds, NaN if missing
+
+
+class ExifStore():
+    """Columnar store of image metadata, saved as a single NumPy .npz file.
+
+    Every column is a NumPy array with one row per image, keyed by the image path relative to the
+    corpus root. Lookups go through an in-memory path index, so tools can read the metadata of an
+    image instead of parsing its EXIF data again.
+    """
+    def __init__(self, store_path):
+        """
+        Args:
+            store_path (string): Path of the .npz file, loaded if it exists.
+        """
+        self.store_path = store_path
+        self.columns = {name: np.array([], dtype=str) for name in TEXT_COLUMNS}
+        self.columns.update({name: np.empty((0, 3)) for name in GPS_COLUMNS})
+        if os.path.exists(store_path):
+            with np.load(store_path, allow_pickle=False) as data:
+                self.columns = {name: data[name] for name in TEXT_COLUMNS + GPS_COLUMNS}
+        self._index = None
+
+    def __len__(self):
+        return len(self.columns['path'])
+
+    def __contains__(self, path):
+        return path in self.index()
+
+    def index(self):
+        """Gets the row of every stored path, building the index on first use.
+
+        Returns:
+            A dict mapping paths to row numbers.
+        """
+        if self._index is None:
+            self._index = {path: row for row, path in enumerate(self.columns['path'].tolist())}
+        return self._index
+
+    def lookup(self, path):
+        """Gets the metadata of a single image.
+
+        Args:
+            path (string): Image path relative to the corpus root.
+
+        Returns:
+            A record like exif_functions.extract_metadata returns, or None if the path is not stored.
+        """
+        row = self.index().get(path)
+        if row is None:
+            return None
+        record = {name: str(self.columns[name][row]) for name in TEXT_COLUMNS}
+        for name in GPS_COLUMNS:
+            dms = self.columns[name][row]
+            record[name] = None if np.isnan(dms).any() else tuple(dms.tolist())
+        return record
+
+    def coordinates(self):
+        """Converts the GPS columns of all images to decimal degrees in one vectorized pass.
+
+        Returns:
+            (latitudes, longitudes) arrays with a row per image, NaN for images without GPS data.
+        """
+        return (exif_functions.gps_to_decimal(self.columns['gps_lat'], self.columns['gps_lat_ref']),
+                exif_functions.gps_to_decimal(self.columns['gps_lon'], self.columns['gps_lon_ref']))
+
+    def add(self, paths, records):
+        """Appends or replaces the metadata of a batch of images.
+
+        Args:
+            paths (list of strings): Image paths relative to the corpus root.
+            records (list of dicts): Records from exif_functions.extract_metadata, in path order.
+        """
+        if not paths:
+            return
+        batch = {'path': np.array(paths, dtype=str)}
+        for name in TEXT_COLUMNS[1:]:
+            batch[name] = np.array([record[name] for record in records], dtype=str)
+        for name in GPS_COLUMNS:
+            batch[name] = np.array([record[name] or (np.nan,) * 3 for record in records], dtype=float).reshape(-1, 3)
+
+        index = self.index()
+        replaced = [index[path] for path in paths if path in index]
+        if replaced:
+            survivors = np.ones(len(self), dtype=bool)
+            survivors[replaced] = False
+            self.columns = {name: column[survivors] for name, column in self.columns.items()}
+        self.columns = {name: np.concatenate([self.columns[name], batch[name]]) for name in self.columns}
+        self._index = None
+
+    def save(self):
+        """Writes the store through a temporary file, so an interrupted save keeps the old store."""
+        tmp_path = f'{self.store_path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **self.columns)
+        os.replace(tmp_path, self.store_path)
+
+
+def find_images(root_dir, extensions=IMAGE_EXTENSIONS):
+    """Lists the images below a directory, by default those that can carry EXIF data.
+
+    Args:
+        root_dir (string): The corpus root.
+        extensions (tuple of strings): Lowercase file extensions to include.
+
+    Returns:
+        A sorted list of image paths relative to root_dir.
+    """
+    paths = []
+    for root, _, files in os.walk(root_dir):
+        for name in files:
+            if name.lower().endswith(extensions):
+                paths.append(os.path.relpath(os.path.join(root, name), root_dir))
+    return sorted(paths)
+
+def extract_exif_batch(store, root_dir, paths=None, processes=None, chunksize=256, save_every=10000):
+    """Extracts the metadata of every image missing from the store across a process pool.
+
+    Args:
+        store (ExifStore): The store to fill, saved every save_every images and at the end.
+        root_dir (string): The corpus root that the stored paths are relative to.
+        paths (list of strings): Relative image paths, all images below root_dir if None.
+        processes (int): Number of worker processes, defaults to the number of CPUs.
+        chunksize (int): Number of images sent to a worker at once.
+        save_every (int): Number of extracted images between intermediate saves.
+
+    Returns:
+        The number of images extracted.
+    """
+    if paths is None:
+        paths = find_images(root_dir)
+    index = store.index()
+    todo = [path for path in paths if path not in index]
+    full_paths = (os.path.join(root_dir, path) for path in todo)
+
+    done = 0
+    batch_paths, batch_records = [], []
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        for path, record in zip(todo, pool.map(exif_functions.extract_metadata, full_paths, chunksize=chunksize)):
+            batch_paths.append(path)
+            batch_records.append(record)
+            if len(batch_paths) >= save_every:
+                store.add(batch_paths, batch_records)
+                store.save()
+                done += len(batch_paths)
+                batch_paths, batch_records = [], []
+    store.add(batch_paths, batch_records)
+    store.save()
+    return done + len(batch_paths)
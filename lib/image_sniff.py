@@ -0,0 +1,149 @@
+import struct
+
+HEADER_LIMIT = 1024 * 1024 # Stop looking for the dimensions after this many bytes
+MAGIC_BYTES = [(b'\xff\xd8\xff', 'JPEG'),
+               (b'\x89PNG\r\n\x1a\n', 'PNG'),
+               (b'GIF87a', 'GIF'),
+               (b'GIF89a', 'GIF'),
+               (b'BM', 'BMP'),
+               (b'II*\x00', 'TIFF'),
+               (b'MM\x00*', 'TIFF')]
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+class ImageRejected(Exception):
+    """Raised when a download turns out not to be an acceptable image before it is complete."""
+
+
+def sniff_format(head):
+    """Identifies an image format from its magic bytes.
+
+    Args:
+        head (bytes): The first bytes of the payload, at least 16 for reliable results.
+
+    Returns:
+        The PIL format name, or None if the payload is not a supported image.
+    """
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'WEBP'
+    for magic, image_format in MAGIC_BYTES:
+        if head.startswith(magic):
+            return image_format
+    return None
+
+def _jpeg_dimensions(head):
+    """Finds the frame header of a JPEG and reads its size."""
+    pos = 2
+    while pos + 9 <= len(head):
+        if head[pos] != 0xFF:
+            return None # Corrupt segment structure, leave it to the decoder
+        marker = head[pos + 1]
+        if marker == 0xFF: # Fill byte
+            pos += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8: # Markers without a length
+            pos += 2
+            continue
+        if marker in JPEG_SOF_MARKERS:
+            height, width = struct.unpack('>HH', head[pos + 5:pos + 9])
+            return width, height
+        pos += 2 + struct.unpack('>H', head[pos + 2:pos + 4])[0]
+    return None
+
+def _webp_dimensions(head):
+    """Reads the size of a lossy, lossless or extended WEBP."""
+    chunk = head[12:16]
+    if chunk == b'VP8 ' and len(head) >= 30:
+        width, height = struct.unpack('<HH', head[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b'VP8L' and len(head) >= 25:
+        b0, b1, b2, b3 = head[21:25]
+        return 1 + (b0 | (b1 & 0x3F) << 8), 1 + (b1 >> 6 | b2 << 2 | (b3 & 0x0F) << 10)
+    if chunk == b'VP8X' and len(head) >= 30:
+        return 1 + int.from_bytes(head[24:27], 'little'), 1 + int.from_bytes(head[27:30], 'little')
+    return None
+
+def read_dimensions(head, image_format):
+    """Reads the pixel dimensions of an image from its header, without decoding it.
+
+    Args:
+        head (bytes): The first bytes of the payload.
+        image_format (string): Format returned by sniff_format.
+
+    Returns:
+        A (width, height) tuple, or None if the header is incomplete or the format is not parsed.
+    """
+    if image_format == 'JPEG':
+        return _jpeg_dimensions(head)
+    if image_format == 'PNG' and len(head) >= 24:
+        return struct.unpack('>II', head[16:24])
+    if image_format == 'GIF' and len(head) >= 10:
+        return struct.unpack('<HH', head[6:10])
+    if image_format == 'BMP' and len(head) >= 26:
+        width, height = struct.unpack('<ii', head[18:26])
+        return abs(width), abs(height) # Top-down bitmaps have a negative height
+    if image_format == 'WEBP':
+        return _webp_dimensions(head)
+    return None
+
+def is_non_image_type(content_type):
+    """Checks whether a Content-Type header rules out an image payload.
+
+    Only clear non-image types are ruled out, since many hosts send images as octet streams.
+
+    Args:
+        content_type (string): The Content-Type header, may be None.
+
+    Returns:
+        True if the payload is text, markup or data.
+    """
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    return content_type.startswith('text/') or any(kind in content_type for kind in ['html', 'json', 'xml'])
+
+def read_image_stream(response, max_bytes=None, max_pixels=None, max_side=None, chunk_size=64 * 1024):
+    """Reads a streamed image response, aborting as soon as it is known to be unacceptable.
+
+    The headers and the magic bytes of the first chunk reject non-images before the body is read.
+    The dimensions are read from the image header as soon as it arrives, and the byte cap is
+    enforced while reading, so at most max_bytes plus one chunk is ever held in memory.
+
+    Args:
+        response (requests.Response): A response requested with stream=True.
+        max_bytes (int): Maximum payload size in bytes, None for no limit.
+        max_pixels (int): Maximum width times height, None for no limit.
+        max_side (int): Maximum width or height in pixels, None for no limit.
+        chunk_size (int): Number of bytes read at once.
+
+    Returns:
+        The complete payload as a bytearray, which is not copied again.
+
+    Raises:
+        ImageRejected: If the payload is not a supported image or exceeds a cap.
+    """
+    if is_non_image_type(response.headers.get('Content-Type')):
+        raise ImageRejected(f"Content-Type {response.headers.get('Content-Type')}")
+    length = response.headers.get('Content-Length')
+    if max_bytes and length and length.isdigit() and int(length) > max_bytes:
+        raise ImageRejected(f"Content-Length {length} exceeds {max_bytes} bytes")
+
+    data = bytearray()
+    image_format = None
+    dimensions = None
+    for chunk in response.iter_content(chunk_size=chunk_size):
+        data += chunk
+        if max_bytes and len(data) > max_bytes:
+            raise ImageRejected(f"Payload exceeds {max_bytes} bytes")
+        if image_format is None and len(data) >= 16:
+            image_format = sniff_format(data[:16])
+            if image_format is None:
+                raise ImageRejected(f"Not an image, starts with {bytes(data[:16])!r}")
+        if image_format and dimensions is None and len(data) <= HEADER_LIMIT + chunk_size:
+            dimensions = read_dimensions(data[:HEADER_LIMIT], image_format)
+            if dimensions:
+                width, height = dimensions
+                if (max_pixels and width * height > max_pixels) or (max_side and max(width, height) > max_side):
+                    raise ImageRejected(f"Dimensions {width}x{height} exceed the caps")
+
+    if image_format is None and sniff_format(data) is None:
+        raise ImageRejected(f"Not an image, {len(data)} bytes")
+    return data
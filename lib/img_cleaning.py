@@ -1,42 +1,64 @@
-from os import path, walk
+from os import path, scandir
 import numpy as np
 import sys
 
 import matplotlib.pyplot as plt
-from scipy import misc
 import time
 
 from data_management import exif_functions
+from data_management.img_prefetch import ImagePrefetcher
+from data_management.label_buffer import LabelBuffer
 from data_management import image_manipulations as i_manips
 from data_management.data_utils import ImgDatabaseHandler      
 
 class ImageCleaner():
-    def __init__(self, db_root, target_table):
+    def __init__(self, db_root, target_table, exif_store=None, prefetch_ahead=8, preview_side=1024,
+                 flush_every=50, flush_interval=30, hidden_paths=None):
         self.db_handler = ImgDatabaseHandler(db_root)
         self.target_table = target_table
+        self.exif_store = exif_store # ExifStore with pre-extracted metadata, keyed by path below root_dir
+        self.label_buffer = LabelBuffer(self.db_handler, target_table, self._image_metadata,
+                                        flush_every=flush_every, flush_interval=flush_interval) # Labels are written in batches
         self.previous_img_path = None
-        self.previous_geo = None
-        self.previous_time = None        
+        self.previous_metadata_path = None # Full path of the previous image if it was labelled, to resolve its metadata
         self.current_index = 0
-        
-    def skip_to_folder(self, all_folders, folder_name):
-        index = all_folders.index(folder_name)
-        folders_after_split = all_folders[index:]
-        return(folders_after_split)
-            
+        self.prefetch_ahead = prefetch_ahead # Number of upcoming images decoded in the background
+        self.preview_side = preview_side
+        self.prefetcher = None # Started per session, its decoding threads are stopped by close()
+        self.figure = None # Reused for every image, a new figure per image leaks memory
+        self.axes_image = None
+        self.labelled = set() # Paths below root_dir stored in the target table before this session
+        self.skip_labelled = True
+        self.hidden_paths = set(hidden_paths or ()) # Paths below root_dir never shown, e.g. PerceptualHashes.duplicates()
 
-    def clean_images(self, analysis_folder, root_dir, target_class, skip_to_folder_name=None):
+    def clean_images(self, analysis_folder, root_dir, target_class, skip_to_folder_name=None, skip_labelled=True):
         self.db_handler.create_img_table(self.target_table)
+        self.skip_labelled = skip_labelled # Resume at the first image not yet stored in the target table
+        self.labelled = self._stored_paths() if skip_labelled else set()
+        self.prefetcher = ImagePrefetcher(max_side=self.preview_side)
+        manifest = build_manifest(analysis_folder)
+        start = 0
         if skip_to_folder_name is not None:
-            all_folders = [x[0] for x in walk(analysis_folder)]
-            full_skip_folder = path.join(analysis_folder,skip_to_folder_name)
-            folders_after_index = self.skip_to_folder(all_folders, full_skip_folder)
+            folder_positions = {root: position for position, (root, _) in enumerate(manifest)}
+            start = folder_positions[path.join(analysis_folder,skip_to_folder_name)]
         print(f'''Determine whether image is of class {target_class}: 
                 1 or empty is true, 0 is false, q to quit, sp to save previous, rp to remove previous, index to skip to an index''')
-        for root, _, files in walk(analysis_folder):
-            if skip_to_folder_name:
-                if not root in folders_after_index:
-                    continue
+        try:
+            self._clean_folders(manifest[start:], root_dir, target_class)
+        finally:
+            self.close() # Also on crashes and interrupts, buffered labels are never lost
+
+    def _stored_paths(self):
+        if not hasattr(self.db_handler, 'get_stored_paths'):
+            print('Warning: database handler cannot list stored paths, labelled images are not skipped')
+            return set()
+        return set(self.db_handler.get_stored_paths(self.target_table))
+
+    def _clean_folders(self, manifest, root_dir, target_class):
+        for root, files in manifest:
+            self.current_index = self._first_unskipped(root, files, root_dir)
+            if self.current_index == len(files):
+                continue # Fully labelled in an earlier session or hidden
             print(f"\n\n\n\n\nNow in folder {root}\n\n\n\n\n")
             time.sleep(0.5) # Too easy to miss folder switches otherwise
             while self.current_index < len(files):
@@ -46,65 +68,138 @@ class ImageCleaner():
                     continue
                 img = files[self.current_index]
                 img_path = path.join(root,img)
+                if self._is_skipped(img_path, root_dir):
+                    self.current_index += 1
+                    continue
                 if i_manips.is_image(img_path):
-                    plt.figure(figsize = (8,8))
-                    image = misc.imread(img_path) # Scikit because plotting PIL images doesn't work with Spyder QTConsole
-                    plt.imshow(image, aspect='auto')
-                    plt.show(block=False) # To force image render while user input is also in the pipeline
+                    image = self.prefetcher.get(img_path, self._upcoming_images(root, files, root_dir)) # Array because plotting PIL images doesn't work with Spyder QTConsole
+                    self._show_image(image)
                     print(f'Index {self.current_index}: {img_path}')
-                    response = str(input(f'Is this image representative of class {target_class}?: ')).lower()
+                    response = str(self._ask(f'Is this image representative of class {target_class}?: ')).lower()
                     self._handle_response(response, target_class, img_path, root_dir)
                 self.current_index += 1
             self.current_index = 0
     
+    def _is_skipped(self, img_path, root_dir):
+        path_without_root = img_path.split(root_dir)[1]
+        if path_without_root.lstrip('/') in self.hidden_paths:
+            return True
+        return self.skip_labelled and path_without_root in self.labelled
+
+    def _first_unskipped(self, root, files, root_dir):
+        for index, img in enumerate(files):
+            if not self._is_skipped(path.join(root, img), root_dir):
+                return index
+        return len(files)
+
+    def _upcoming_images(self, root, files, root_dir):
+        upcoming = [path.join(root, img) for img in files[self.current_index + 1:self.current_index + 1 + self.prefetch_ahead]]
+        return [img_path for img_path in upcoming if not self._is_skipped(img_path, root_dir) and i_manips.is_image(img_path)]
+
+    def _show_image(self, image):
+        if self.figure is None or not plt.fignum_exists(self.figure.number):
+            self.figure = plt.figure(figsize = (8,8))
+            self.axes_image = plt.imshow(image, aspect='auto')
+        else:
+            self.axes_image.set_data(image)
+            self.axes_image.set_extent((-0.5, image.shape[1] - 0.5, image.shape[0] - 0.5, -0.5))
+        self.figure.canvas.draw_idle()
+        plt.show(block=False) # To force image render while user input is also in the pipeline
+        plt.pause(0.001)
+
+    def _ask(self, prompt):
+        self.label_buffer.flush_if_due() # Labels buffered long enough are written before waiting on the labeller
+        return input(prompt)
+
+    def close(self):
+        self.label_buffer.flush()
+        if self.prefetcher is not None:
+            self.prefetcher.close()
+            self.prefetcher = None
+        if self.figure is not None:
+            plt.close(self.figure)
+            self.figure = None
+
     def _handle_response(self, response, img_class, img_path, root_dir):
-        time = -9999
-        geo = ['','']
+        metadata_path = None
         path_without_root = img_path.split(root_dir)[1]
         if response in ['', '1', '2']:
             if response == '2': # Save image with different class name
-                img_class = str(input(f'Which alternative image class is this image?: '))            
+                img_class = str(self._ask(f'Which alternative image class is this image?: '))            
             
-            img_exif = exif_functions.get_exif_if_exists(img_path)
-            if img_exif:
-                exif_with_geo = exif_functions.decode_geo(img_exif)
-                if 'DateTimeOriginal' in img_exif.keys():
-                    time = img_exif['DateTimeOriginal']
-                if 'GPSInfo' in img_exif.keys():
-                    geo = ['yes', 'yes'] # To implement later
-            
-            self.db_handler.store_image_details(self.target_table, img_class, path_without_root, geo, time)            
+            self.label_buffer.store(img_class, path_without_root, img_path) # Metadata is read when the buffer is written
+            metadata_path = img_path
             
         elif response == 'sp':
-            self.db_handler.store_image_details(self.target_table, img_class, self.previous_img_path, self.previous_geo, self.previous_time)
-            response = str(input(f'Is this image representative of class {img_class}?: '))
+            self.label_buffer.store(img_class, self.previous_img_path, self.previous_metadata_path)
+            response = str(self._ask(f'Is this image representative of class {img_class}?: '))
             self._handle_response(response, img_class, img_path, root_dir)
         elif response == 'rp':
-            self.db_handler.remove_record(self.target_table, self.previous_img_path)
-            response = str(input(f'Is this image representative of class {img_class}?: '))
+            self.label_buffer.remove(self.previous_img_path)
+            response = str(self._ask(f'Is this image representative of class {img_class}?: '))
             self._handle_response(response, img_class, img_path, root_dir)
         elif response == '0':
             pass             
         elif response == 'index':
             self._set_index()
         elif response == 'q':
+            self.close()
             sys.exit()
         else:
             print(f'''Determine whether image is of class {img_class}: 
                 1 or empty for true, 0 for false, q to quit, sp to save previous, rp to remove previous''')            
-            response = str(input(f'Is this image representative of class {img_class}?: '))
+            response = str(self._ask(f'Is this image representative of class {img_class}?: '))
             self._handle_response(response, img_class, img_path, root_dir)
             
         self.previous_img_path = path_without_root     
-        self.previous_geo = geo
-        self.previous_time = time
+        self.previous_metadata_path = metadata_path
+
+    def _image_metadata(self, img_path, path_without_root):
+        time = -9999
+        geo = ['','']
+        if img_path is None:
+            return geo, time
+        record = self.exif_store.lookup(path_without_root.lstrip('/')) if self.exif_store else None
+        if not record:
+            record = exif_functions.extract_metadata(img_path) # Never raises, so a bad file cannot fail a batch
+        if record['timestamp']:
+            time = record['timestamp']
+        if record['gps_lat'] and record['gps_lon']:
+            geo = [float(exif_functions.gps_to_decimal(record['gps_lat'], [record['gps_lat_ref']])[0]),
+                   float(exif_functions.gps_to_decimal(record['gps_lon'], [record['gps_lon_ref']])[0])]
+        return geo, time
             
     def _set_index(self):
         index = None
         while not type(index) == int:
             try:
-                index = int(input(f'Type an index to skip to: '))
+                index = int(self._ask(f'Type an index to skip to: '))
             except ValueError:
                 print("Not an integer")
         self.current_index = index-1 #-1 to offset iteration increment        
-            
\ No newline at end of file
+            
+
+
+def build_manifest(analysis_folder):
+    """Lists every folder below analysis_folder with its files in a single scandir pass.
+
+    Args:
+        analysis_folder (string): The folder to list.
+
+    Returns:
+        A list of (folder, sorted file names) tuples, top-down with folders in name order.
+    """
+    manifest = []
+    pending = [analysis_folder]
+    while pending:
+        root = pending.pop()
+        files, folders = [], []
+        with scandir(root) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    folders.append(entry.path)
+                else:
+                    files.append(entry.name)
+        manifest.append((root, sorted(files)))
+        pending.extend(sorted(folders, reverse=True))
+    return manifest
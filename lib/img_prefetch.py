@@ -0,0 +1,77 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+
+def load_preview(img_path, max_side=1024):
+    """Decodes an image at display size.
+
+    JPEGs are decoded in draft mode, so the decoder already scales down by up to 8x and a large
+    photo costs a fraction of a full-resolution decode.
+
+    Args:
+        img_path (string): Path of the image file.
+        max_side (int): Maximum length of the longest side in pixels.
+
+    Returns:
+        The image as an RGB uint8 array.
+    """
+    with Image.open(img_path) as img:
+        img.draft('RGB', (max_side, max_side))
+        img = img.convert('RGB')
+        img.thumbnail((max_side, max_side), Image.BILINEAR, reducing_gap=2.0)
+        return np.asarray(img)
+
+
+class ImagePrefetcher():
+    """Decodes upcoming images in the background while the current one is being labelled.
+
+    Holds at most the current image and the requested upcoming images; everything else is evicted,
+    so memory stays flat over long sessions regardless of how the labeller jumps around.
+    """
+    def __init__(self, max_side=1024, workers=2):
+        """
+        Args:
+            max_side (int): Maximum length of the longest side of the decoded previews in pixels.
+            workers (int): Number of decoding threads. PIL releases the GIL while decoding.
+        """
+        self.max_side = max_side
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.cache = OrderedDict() # path -> future of the decoded preview
+        self.lock = threading.Lock()
+
+    def _submit(self, img_path):
+        """Starts decoding an image unless it is already cached. Caller must hold the lock."""
+        if img_path not in self.cache:
+            self.cache[img_path] = self.pool.submit(load_preview, img_path, self.max_side)
+        return self.cache[img_path]
+
+    def get(self, img_path, upcoming=()):
+        """Gets the preview of an image and starts decoding the images after it.
+
+        Args:
+            img_path (string): The image to show now.
+            upcoming (list of strings): The images expected next, in order.
+
+        Returns:
+            The decoded preview as an RGB uint8 array.
+        """
+        with self.lock:
+            current = self._submit(img_path)
+            keep = {img_path, *upcoming}
+            for path in upcoming:
+                self._submit(path)
+            for path in [path for path in self.cache if path not in keep]:
+                self.cache.pop(path).cancel()
+        return current.result()
+
+    def close(self):
+        """Drops all cached previews and stops the decoding threads."""
+        with self.lock:
+            for future in self.cache.values():
+                future.cancel()
+            self.cache.clear()
+        self.pool.shutdown(wait=False)
@@ -0,0 +1,191 @@
+import sqlite3
+import threading
+import time
+
+DONE = 'done'
+FAILED = 'failed'
+EXHAUSTED = 'exhausted' # Search pages beyond the last page with results
+
+
+class JobJournal():
+    """Append-only journal of search and image download outcomes.
+
+    Every search page and image URL that finishes is appended as an event. On start-up the events are
+    replayed into memory, so an interrupted scrape can skip the work it already completed. Events are
+    buffered and written in batches, which keeps journaling cheap inside the download pipeline.
+    """
+    def __init__(self, db_path, retry_failed=False, flush_every=200, flush_interval=5.0):
+        """
+        Args:
+            db_path (string): Path of the SQLite journal file, created if it does not exist.
+            retry_failed (bool or list of strings): Retry failed image downloads of all providers if
+                True, or only those of the listed providers.
+            flush_every (int): Number of buffered events that triggers a write.
+            flush_interval (float): Maximum number of seconds events stay buffered.
+        """
+        self.db_path = db_path
+        self.retry_failed = retry_failed
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+
+        self.lock = threading.Lock()
+        self.buffer = []
+        self.last_flush = time.time()
+        self.searches = {}
+        self.urls = {}
+        self.failed = {} # (provider, query) -> failed URLs, to redo pages when retrying
+
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                time REAL NOT NULL,
+                kind TEXT NOT NULL,
+                provider TEXT NOT NULL,
+                query TEXT NOT NULL,
+                unit TEXT NOT NULL,
+                status TEXT NOT NULL
+            )''')
+        self.conn.commit()
+        self._replay()
+
+    def _replay(self):
+        """Loads the latest outcome of every journaled unit into memory."""
+        for kind, provider, query, unit, status in self.conn.execute(
+                'SELECT kind, provider, query, unit, status FROM events ORDER BY id'):
+            self._apply(kind, provider, query, unit, status)
+
+    def _apply(self, kind, provider, query, unit, status):
+        """Updates the in-memory state with a single event.
+
+        Args:
+            kind (string): 'search' for result pages, 'url' for image downloads.
+            provider (string): Name of the API the unit belongs to.
+            query (string): The search query of the unit.
+            unit (string): The page number or the image URL.
+            status (string): Outcome of the unit.
+        """
+        if kind == 'search':
+            self.searches[(provider, query, unit)] = status
+            return
+        self.urls[unit] = (provider, query, status)
+        failed = self.failed.setdefault((provider, query), set())
+        if status == FAILED:
+            failed.add(unit)
+        else:
+            failed.discard(unit)
+
+    def _append(self, kind, provider, query, unit, status):
+        """Buffers an event and writes the buffer out when it is full or old enough."""
+        with self.lock:
+            self._apply(kind, provider, query, unit, status)
+            self.buffer.append((time.time(), kind, provider, query, unit, status))
+            if len(self.buffer) >= self.flush_every or time.time() - self.last_flush > self.flush_interval:
+                self._flush()
+
+    def _flush(self):
+        """Writes the buffered events in a single transaction. Caller must hold the lock."""
+        if self.buffer:
+            with self.conn:
+                self.conn.executemany('INSERT INTO events (time, kind, provider, query, unit, status) '
+                                      'VALUES (?, ?, ?, ?, ?, ?)', self.buffer)
+            self.buffer = []
+        self.last_flush = time.time()
+
+    def search_done(self, provider, query, page):
+        """Checks whether a search page and all of its images were completed in an earlier run.
+
+        Args:
+            provider (string): Name of the API.
+            query (string): Image search query.
+            page (int): The page index.
+
+        Returns:
+            True if the page can be skipped. Pages of queries with failed images that are selected
+            for a retry are never skipped, so the failed images get another attempt.
+        """
+        with self.lock:
+            status = self.searches.get((provider, query, str(page)))
+            if status == EXHAUSTED:
+                return True
+            if status != DONE:
+                return False
+            return not (self._retries(provider) and self.failed.get((provider, query)))
+
+    def record_search(self, provider, query, page, status):
+        """Journals the outcome of a search page.
+
+        Args:
+            provider (string): Name of the API.
+            query (string): Image search query.
+            page (int): The page index.
+            status (string): DONE once all images of the page were processed, EXHAUSTED if the
+                result set ended before this page, FAILED otherwise.
+        """
+        self._append('search', provider, query, str(page), status)
+
+    def url_done(self, url):
+        """Checks whether an image URL needs no further download attempt.
+
+        Args:
+            url (string): The image source URL.
+
+        Returns:
+            True if the URL completed before, or failed before and is not selected for a retry.
+        """
+        with self.lock:
+            entry = self.urls.get(url)
+        if entry is None:
+            return False
+        provider, _, status = entry
+        return status == DONE or not self._retries(provider)
+
+    def _retries(self, provider):
+        """Checks whether failed downloads of a provider are selected for a retry.
+
+        Args:
+            provider (string): Name of the API.
+
+        Returns:
+            True if failed units of the provider should be attempted again.
+        """
+        if self.retry_failed is True:
+            return True
+        return bool(self.retry_failed) and provider in self.retry_failed
+
+    def record_url(self, provider, query, url, status):
+        """Journals the outcome of an image download.
+
+        Args:
+            provider (string): Name of the API.
+            query (string): Image search query that returned the URL.
+            url (string): The image source URL.
+            status (string): DONE if the image was stored or is a known duplicate, FAILED otherwise.
+        """
+        self._append('url', provider, query, url, status)
+
+    def failed_urls(self, provider=None):
+        """Lists the image downloads whose latest outcome is a failure.
+
+        Args:
+            provider (string): Only list failures of this API, all APIs if None.
+
+        Returns:
+            A list of (provider, query, url) tuples.
+        """
+        with self.lock:
+            return [(p, q, url) for url, (p, q, status) in self.urls.items()
+                    if status == FAILED and provider in (None, p)]
+
+    def flush(self):
+        """Writes all buffered events."""
+        with self.lock:
+            self._flush()
+
+    def close(self):
+        """Writes all buffered events and closes the journal."""
+        with self.lock:
+            self._flush()
+            self.conn.close()
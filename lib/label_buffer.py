@@ -0,0 +1,94 @@
+import time
+
+
+class LabelBuffer():
+    """Write-behind buffer for image labels.
+
+    Labels and removals are buffered and written in two batched database calls, once enough
+    operations are buffered or the oldest one is old enough. Removing a path drops its buffered
+    labels, so an undone label never reaches the database, and the removal itself is replayed before
+    any later labels of that path. EXIF metadata is resolved at flush time instead of per keypress.
+    """
+    def __init__(self, db_handler, table, resolve_metadata, flush_every=50, flush_interval=30.0):
+        """
+        Args:
+            db_handler (ImgDatabaseHandler): Database receiving the batched writes.
+            table (string): The target table.
+            resolve_metadata (function): Maps (img_path, path_without_root) to (geo, time).
+            flush_every (int): Number of buffered operations that triggers a write.
+            flush_interval (float): Maximum number of seconds operations stay buffered.
+        """
+        self.db_handler = db_handler
+        self.table = table
+        self.resolve_metadata = resolve_metadata
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.rows = [] # Labels to store, in input order
+        self.removals = [] # Paths to remove before storing the rows
+        self.oldest = None
+
+    def __len__(self):
+        return len(self.rows) + len(self.removals)
+
+    def store(self, img_class, path_without_root, img_path):
+        """Buffers a label.
+
+        Args:
+            img_class (string): The label.
+            path_without_root (string): Image path below the root directory, as stored.
+            img_path (string): Full image path, used to resolve the metadata.
+        """
+        self.rows.append({'class': img_class, 'path': path_without_root, 'img_path': img_path})
+        self._touched()
+
+    def remove(self, path_without_root):
+        """Buffers the removal of all labels of an image, dropping its buffered labels.
+
+        Args:
+            path_without_root (string): Image path below the root directory, as stored.
+        """
+        self.rows = [row for row in self.rows if row['path'] != path_without_root]
+        if path_without_root not in self.removals:
+            self.removals.append(path_without_root)
+        self._touched()
+
+    def _touched(self):
+        if self.oldest is None:
+            self.oldest = time.time()
+        if len(self) >= self.flush_every:
+            self.flush()
+        else:
+            self.flush_if_due()
+
+    def flush_if_due(self):
+        """Writes the buffered operations if the oldest one is older than flush_interval.
+
+        Call it before blocking on user input, so labels are not held back while the labeller is idle.
+        """
+        if self.oldest is not None and time.time() - self.oldest > self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Writes all buffered operations, removals first, then the labels in input order.
+
+        Uses the handler's batch methods if it has them, and its per-record methods otherwise.
+        """
+        if self.removals:
+            if hasattr(self.db_handler, 'remove_records'):
+                self.db_handler.remove_records(self.table, self.removals)
+            else: # Handlers without batch methods get one call per operation
+                for path_without_root in self.removals:
+                    self.db_handler.remove_record(self.table, path_without_root)
+            self.removals = []
+        if self.rows:
+            details = []
+            for row in self.rows:
+                geo, img_time = self.resolve_metadata(row['img_path'], row['path'])
+                details.append((row['class'], row['path'], geo, img_time))
+            if hasattr(self.db_handler, 'store_image_details_batch'):
+                self.db_handler.store_image_details_batch(self.table, details)
+            else:
+                for img_class, path_without_root, geo, img_time in details:
+                    self.db_handler.store_image_details(self.table, img_class, path_without_root, geo, img_time)
+            self.rows = []
+        self.oldest = None
@@ -0,0 +1,236 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+def _label_key(labels):
+    """Turns keyword labels into a hashable, ordered key."""
+    return tuple(sorted(labels.items()))
+
+def _write_atomic(path, text):
+    """Writes a file through a temporary file, so readers never see a partial export.
+
+    Args:
+        path (string): Target file path.
+        text (string): File contents.
+    """
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+class Tracer():
+    """Records timed spans in the Chrome trace event format.
+
+    The saved file can be opened in chrome://tracing or Perfetto to see per-thread timelines.
+    """
+    def __init__(self, max_events=1000000):
+        """
+        Args:
+            max_events (int): Maximum number of spans kept, later spans are dropped.
+        """
+        self.max_events = max_events
+        self.events = []
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+
+    def add_span(self, name, start, duration, **args):
+        """Records a completed span.
+
+        Args:
+            name (string): Span name, e.g. the pipeline stage.
+            start (float): Start as a time.perf_counter() value.
+            duration (float): Duration in seconds.
+            **args: Extra details shown with the span.
+        """
+        event = {'name': name, 'ph': 'X', 'ts': start * 1e6, 'dur': duration * 1e6,
+                 'pid': self.pid, 'tid': threading.get_ident(), 'args': args}
+        with self.lock:
+            if len(self.events) < self.max_events:
+                self.events.append(event)
+
+    def save(self, path):
+        """Writes the recorded spans to a trace file.
+
+        Args:
+            path (string): Output path of the JSON trace.
+        """
+        with self.lock:
+            events = list(self.events)
+        _write_atomic(path, json.dumps({'traceEvents': events}))
+
+
+class Metrics():
+    """Thread-safe counters and timers for the scrape pipeline.
+
+    Counters and timers are keyed by name and labels (e.g. provider and error type). Snapshots can be
+    exported as JSON or as a Prometheus textfile, once or periodically.
+    """
+    def __init__(self, prefix='scraper', tracer=None):
+        """
+        Args:
+            prefix (string): Prefix of the exported Prometheus metric names.
+            tracer (Tracer): Optional tracer receiving a span for every timed section.
+        """
+        self.prefix = prefix
+        self.tracer = tracer
+        self.started_at = time.time()
+        self.counters = {}
+        self.timers = {} # key -> [count, total seconds, max seconds]
+        self.lock = threading.Lock()
+        self._stop_export = None
+
+    def incr(self, name, value=1, **labels):
+        """Increments a counter.
+
+        Args:
+            name (string): Counter name.
+            value (float): Amount to add.
+            **labels: Labels distinguishing the series, e.g. provider='bing'.
+        """
+        key = (name, _label_key(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        """Records a duration for a timer.
+
+        Args:
+            name (string): Timer name.
+            seconds (float): The measured duration.
+            **labels: Labels distinguishing the series.
+        """
+        key = (name, _label_key(labels))
+        with self.lock:
+            timer = self.timers.setdefault(key, [0, 0.0, 0.0])
+            timer[0] += 1
+            timer[1] += seconds
+            timer[2] = max(timer[2], seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Times the enclosed block, also when it raises.
+
+        Args:
+            name (string): Timer name.
+            **labels: Labels distinguishing the series.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            self.observe(name, duration, **labels)
+            if self.tracer:
+                self.tracer.add_span(name, start, duration, **labels)
+
+    def snapshot(self):
+        """Summarizes all counters and timers.
+
+        Returns:
+            A JSON-serializable dict, including images saved per second over the whole run.
+        """
+        with self.lock:
+            counters = dict(self.counters)
+            timers = {key: list(value) for key, value in self.timers.items()}
+        elapsed = time.time() - self.started_at
+        images_saved = sum(value for (name, _), value in counters.items() if name == 'images_saved')
+        return {
+            'time': time.time(),
+            'elapsed_seconds': elapsed,
+            'images_per_second': images_saved / elapsed if elapsed > 0 else 0.0,
+            'counters': [{'name': name, 'labels': dict(labels), 'value': value}
+                         for (name, labels), value in sorted(counters.items())],
+            'timers': [{'name': name, 'labels': dict(labels), 'count': count, 'total_seconds': total,
+                        'mean_seconds': total / count if count else 0.0, 'max_seconds': longest}
+                       for (name, labels), (count, total, longest) in sorted(timers.items())],
+        }
+
+    def export_json(self, path):
+        """Writes a snapshot as JSON.
+
+        Args:
+            path (string): Output file path.
+        """
+        _write_atomic(path, json.dumps(self.snapshot(), indent=2))
+
+    def export_prometheus(self, path):
+        """Writes a snapshot in the Prometheus text exposition format, for the textfile collector.
+
+        Args:
+            path (string): Output file path, which should end in .prom.
+        """
+        snapshot = self.snapshot()
+        lines = [f'{self.prefix}_images_per_second {snapshot["images_per_second"]}',
+                 f'{self.prefix}_elapsed_seconds {snapshot["elapsed_seconds"]}']
+        for counter in snapshot['counters']:
+            lines.append(f'{self.prefix}_{counter["name"]}_total{self._format_labels(counter["labels"])} '
+                         f'{counter["value"]}')
+        for timer in snapshot['timers']:
+            labels = self._format_labels(timer['labels'])
+            lines.append(f'{self.prefix}_{timer["name"]}_seconds_count{labels} {timer["count"]}')
+            lines.append(f'{self.prefix}_{timer["name"]}_seconds_sum{labels} {timer["total_seconds"]}')
+        _write_atomic(path, '\n'.join(lines) + '\n')
+
+    def _format_labels(self, labels):
+        """Formats labels for the Prometheus text format.
+
+        Args:
+            labels (dict): Label names and values.
+
+        Returns:
+            The label block, or an empty string without labels.
+        """
+        if not labels:
+            return ''
+        escape = lambda value: str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in sorted(labels.items())) + '}'
+
+    def start_periodic_export(self, interval=60, json_path=None, prometheus_path=None):
+        """Exports snapshots in a background thread until stop_periodic_export is called.
+
+        Args:
+            interval (float): Seconds between exports.
+            json_path (string): Path of the JSON summary, None to skip.
+            prometheus_path (string): Path of the Prometheus textfile, None to skip.
+        """
+        self._stop_export = threading.Event()
+        stop = self._stop_export
+
+        def export():
+            while not stop.wait(interval):
+                self._export(json_path, prometheus_path)
+
+        threading.Thread(target=export, daemon=True).start()
+        self._export_paths = (json_path, prometheus_path)
+
+    def stop_periodic_export(self):
+        """Stops the periodic export and writes a final snapshot."""
+        if self._stop_export:
+            self._stop_export.set()
+            self._export(*self._export_paths)
+            self._stop_export = None
+
+    def _export(self, json_path, prometheus_path):
+        """Writes the requested exports, reporting rather than raising on failure."""
+        try:
+            if json_path:
+                self.export_json(json_path)
+            if prometheus_path:
+                self.export_prometheus(prometheus_path)
+        except OSError as e:
+            print(f"Could not export metrics\n{str(e)}\n")
+
+
+_default_metrics = Metrics()
+
+def get_default_metrics():
+    """Returns the metrics shared by all callers that were not given their own.
+
+    Returns:
+        The process-wide Metrics instance.
+    """
+    return _default_metrics
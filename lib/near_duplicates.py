@@ -0,0 +1,248 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from data_management.exif_store import find_images
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp', '.tif', '.tiff')
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def _grayscale(img_path, width, height):
+    """Decodes an image as a small grayscale array, using JPEG draft mode to skip most of the decode."""
+    with Image.open(img_path) as img:
+        img.draft('L', (width * 4, height * 4))
+        pixels = img.size[0] * img.size[1]
+        small = img.convert('L').resize((width, height), Image.BILINEAR)
+        return np.asarray(small, dtype=np.float32), pixels
+
+def _pack_bits(bits):
+    """Packs 64 booleans into an unsigned 64-bit integer."""
+    return int(np.packbits(bits.ravel().astype(np.uint8)).view('>u8')[0])
+
+def dhash(img_path):
+    """Computes the 64-bit difference hash of an image.
+
+    Every bit tells whether a pixel is brighter than its right neighbour in a 9x8 thumbnail, which is
+    robust to resizing, recompression and small edits.
+
+    Args:
+        img_path (string): Path of the image file.
+
+    Returns:
+        (hash, pixel count of the original image) tuple.
+    """
+    small, pixels = _grayscale(img_path, 9, 8)
+    return _pack_bits(small[:, 1:] > small[:, :-1]), pixels
+
+_DCT = np.cos(np.pi * np.outer(np.arange(32), 2 * np.arange(32) + 1) / 64)
+
+def phash(img_path):
+    """Computes the 64-bit DCT perceptual hash of an image.
+
+    Every bit tells whether one of the 8x8 lowest DCT frequencies of a 32x32 thumbnail is above their
+    median, which also survives mild watermarks and colour changes.
+
+    Args:
+        img_path (string): Path of the image file.
+
+    Returns:
+        (hash, pixel count of the original image) tuple.
+    """
+    small, pixels = _grayscale(img_path, 32, 32)
+    low = (_DCT @ small @ _DCT.T)[:8, :8]
+    return _pack_bits(low > np.median(low.ravel()[1:])), pixels
+
+HASH_FUNCTIONS = {'dhash': dhash, 'phash': phash}
+
+def _hash_file(args):
+    """Hashes a single file in a worker process, returning None for unreadable files."""
+    method, img_path = args
+    try:
+        return HASH_FUNCTIONS[method](img_path)
+    except Exception:
+        return None
+
+def popcount(values):
+    """Counts the set bits of every value in an array of unsigned 64-bit integers.
+
+    Args:
+        values (array): uint64 values.
+
+    Returns:
+        An array with the bit count of every value.
+    """
+    values = np.ascontiguousarray(values, dtype=np.uint64)
+    return _POPCOUNT[values.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+class PerceptualHashes():
+    """Perceptual hashes of an image corpus, packed in NumPy arrays and saved as a .npz file.
+
+    Near-duplicates are found with multi-index hashing: the 64-bit hashes are split into
+    max_distance + 1 chunks, and two hashes within max_distance bits share at least one chunk
+    exactly. Only pairs sharing a chunk are compared, instead of all pairs.
+    """
+    def __init__(self, paths, hashes, pixels, method='dhash'):
+        """
+        Args:
+            paths (array of strings): Image paths relative to the corpus root.
+            hashes (array): The uint64 hash of every image.
+            pixels (array): Pixel count of every image, the largest copy represents a cluster.
+            method (string): Hash function, 'dhash' or 'phash'.
+        """
+        self.paths = np.asarray(paths, dtype=str)
+        self.hashes = np.asarray(hashes, dtype=np.uint64)
+        self.pixels = np.asarray(pixels, dtype=np.int64)
+        self.method = method
+
+    def __len__(self):
+        return len(self.paths)
+
+    @classmethod
+    def from_corpus(cls, root_dir, paths=None, method='dhash', processes=None, chunksize=256):
+        """Hashes every image of a corpus in a process pool.
+
+        Args:
+            root_dir (string): The corpus root.
+            paths (list of strings): Relative image paths, all images below root_dir if None.
+            method (string): Hash function, 'dhash' or 'phash'.
+            processes (int): Number of worker processes, defaults to the number of CPUs.
+            chunksize (int): Number of images sent to a worker at once.
+
+        Returns:
+            The PerceptualHashes of all readable images.
+        """
+        if paths is None:
+            paths = find_images(root_dir, IMAGE_EXTENSIONS)
+        jobs = ((method, os.path.join(root_dir, path)) for path in paths)
+        kept, hashes, pixels = [], [], []
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            for path, result in zip(paths, pool.map(_hash_file, jobs, chunksize=chunksize)):
+                if result is not None:
+                    kept.append(path)
+                    hashes.append(result[0])
+                    pixels.append(result[1])
+        return cls(kept, np.array(hashes, dtype=np.uint64), pixels, method)
+
+    @classmethod
+    def load(cls, hashes_path):
+        """Loads hashes saved with save.
+
+        Args:
+            hashes_path (string): Path of the .npz file.
+
+        Returns:
+            The PerceptualHashes.
+        """
+        with np.load(hashes_path, allow_pickle=False) as data:
+            return cls(data['paths'], data['hashes'], data['pixels'], str(data['method']))
+
+    def save(self, hashes_path):
+        """Writes the hashes through a temporary file.
+
+        Args:
+            hashes_path (string): Path of the .npz file.
+        """
+        tmp_path = f'{hashes_path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, paths=self.paths, hashes=self.hashes, pixels=self.pixels, method=self.method)
+        os.replace(tmp_path, hashes_path)
+
+    def _chunks(self, hashes, max_distance):
+        """Splits hashes into max_distance + 1 bit ranges.
+
+        Args:
+            hashes (array): uint64 hashes.
+            max_distance (int): Maximum number of differing bits between near-duplicates.
+
+        Returns:
+            A list of uint64 arrays, one per chunk.
+        """
+        parts = max_distance + 1
+        bounds = np.linspace(0, 64, parts + 1).astype(int)
+        chunks = []
+        for low, high in zip(bounds[:-1], bounds[1:]):
+            mask = np.uint64((1 << (high - low)) - 1)
+            chunks.append((hashes >> np.uint64(low)) & mask)
+        return chunks
+
+    def _candidate_pairs(self, keys, max_run):
+        """Yields index pairs that share a chunk value.
+
+        Sorting groups equal keys into runs. Pairs at distance d within the sorted keys are compared
+        one distance at a time, so runs are expanded without a Python loop per run. Runs longer than
+        max_run are compared in blocks instead.
+
+        Args:
+            keys (array): Chunk value of every hash.
+            max_run (int): Longest run expanded by sorted distance.
+
+        Yields:
+            (left indices, right indices) array pairs.
+        """
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        for d in range(1, min(max_run, len(keys))):
+            same = np.flatnonzero(keys[:-d] == keys[d:])
+            if not len(same):
+                return # No run is longer than d
+            yield order[same], order[same + d]
+
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        ends = np.r_[starts[1:], len(keys)]
+        for start, end in zip(starts, ends):
+            if end - start > max_run:
+                run = order[start:end]
+                for row in range(max_run, len(run)):
+                    yield np.full(row - max_run + 1, run[row]), run[:row - max_run + 1]
+
+    def clusters(self, max_distance=4, max_run=256):
+        """Groups the images into near-duplicate clusters.
+
+        Args:
+            max_distance (int): Maximum number of differing hash bits between near-duplicates.
+            max_run (int): Longest bucket expanded by sorted distance, longer buckets are compared
+                in blocks.
+
+        Returns:
+            A list of index arrays, one per cluster with more than one image, each starting with the
+            representative: the image with the most pixels.
+        """
+        # Identical hashes are merged up front, so they do not blow up the buckets of every chunk
+        unique, inverse = np.unique(self.hashes, return_inverse=True)
+        parents = np.arange(len(unique))
+
+        def find(i):
+            while parents[i] != i:
+                parents[i] = parents[parents[i]]
+                i = parents[i]
+            return i
+
+        for keys in self._chunks(unique, max_distance):
+            for left, right in self._candidate_pairs(keys, max_run):
+                near = popcount(unique[left] ^ unique[right]) <= max_distance
+                for a, b in zip(left[near].tolist(), right[near].tolist()):
+                    root_a, root_b = find(a), find(b)
+                    if root_a != root_b:
+                        parents[max(root_a, root_b)] = min(root_a, root_b)
+
+        unique_roots = np.array([find(i) for i in range(len(unique))], dtype=np.int64)
+        roots = unique_roots[inverse.ravel()]
+        order = np.lexsort((-self.pixels, roots)) # By cluster, largest image first
+        roots = roots[order]
+        starts = np.flatnonzero(np.r_[True, roots[1:] != roots[:-1]])
+        return [cluster for cluster in np.split(order, starts[1:]) if len(cluster) > 1]
+
+    def duplicates(self, max_distance=4):
+        """Lists the images that are near-duplicates of a cluster representative.
+
+        Args:
+            max_distance (int): Maximum number of differing hash bits between near-duplicates.
+
+        Returns:
+            A set of relative paths that can be hidden, keeping one image per cluster.
+        """
+        return {path for cluster in self.clusters(max_distance) for path in self.paths[cluster[1:]].tolist()}
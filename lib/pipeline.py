@@ -0,0 +1,95 @@
+import queue
+import threading
+
+_STOP = object() # Sentinel marking the end of a stage's input
+
+
+class StagedPipeline():
+    """Runs work items through a chain of threaded stages.
+
+    Every stage reads from its own bounded queue and hands its output to the next stage's queue, so
+    a slow stage blocks the ones feeding it instead of letting items pile up in memory.
+    """
+    def __init__(self, stages, queue_size=16):
+        """
+        Args:
+            stages (list of tuples): (name, function, workers) per stage, in order. The function
+                receives one item and returns the item for the next stage, or None to drop it.
+            queue_size (int): Maximum number of items waiting in front of each stage.
+        """
+        self.stages = stages
+        self.queue_size = queue_size
+
+    def run(self, items):
+        """Feeds items through all stages and blocks until the pipeline has drained.
+
+        Args:
+            items (iterable): Work items for the first stage. Consumed lazily, so a generator can act
+                as the producing stage.
+
+        Returns:
+            The number of items that made it through the final stage.
+        """
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        completed = [0]
+        lock = threading.Lock()
+        threads = []
+
+        for stage_idx, (name, func, workers) in enumerate(self.stages):
+            in_queue = queues[stage_idx]
+            out_queue = queues[stage_idx + 1] if stage_idx + 1 < len(queues) else None
+            next_workers = self.stages[stage_idx + 1][2] if out_queue else 0
+            remaining = [workers]
+            for _ in range(workers):
+                worker = threading.Thread(target=self._work,
+                                          args=(name, func, in_queue, out_queue, next_workers, remaining, completed, lock),
+                                          daemon=True)
+                worker.start()
+                threads.append(worker)
+
+        try:
+            for item in items:
+                queues[0].put(item)
+        finally:
+            for _ in range(self.stages[0][2]):
+                queues[0].put(_STOP)
+            for worker in threads:
+                worker.join()
+        return completed[0]
+
+    def _work(self, name, func, in_queue, out_queue, next_workers, remaining, completed, lock):
+        """Worker loop for a single stage thread.
+
+        Args:
+            name (string): Stage name for error reporting.
+            func (function): The stage function.
+            in_queue (Queue): Queue to read items from.
+            out_queue (Queue): Queue of the next stage, None for the final stage.
+            next_workers (int): Number of workers in the next stage, which each need a stop sentinel.
+            remaining (list): Shared counter of workers still running in this stage.
+            completed (list): Shared counter of items finished by the final stage.
+            lock (Lock): Guards the shared counters.
+        """
+        while True:
+            item = in_queue.get()
+            if item is _STOP:
+                break
+            try:
+                result = func(item)
+            except Exception as e:
+                result = None
+                print(f"Pipeline stage '{name}' failed\n{str(e)}\n")
+            if result is None:
+                continue
+            if out_queue is not None:
+                out_queue.put(result)
+            else:
+                with lock:
+                    completed[0] += 1
+
+        with lock:
+            remaining[0] -= 1
+            last_worker = remaining[0] == 0
+        if last_worker and out_queue is not None:
+            for _ in range(next_workers):
+                out_queue.put(_STOP)
@@ -0,0 +1,144 @@
+import heapq
+
+
+def normalize_words(text):
+    """Splits a term into lowercase words, dropping repeated words.
+
+    Args:
+        text (string): A search term or query.
+
+    Returns:
+        A list of the unique words in order of first appearance.
+    """
+    words = []
+    for word in text.lower().split():
+        if word not in words:
+            words.append(word)
+    return words
+
+def query_key(words):
+    """Builds a key that is equal for queries differing only in word order or repetition.
+
+    Args:
+        words (list of strings): Normalized query words.
+
+    Returns:
+        A hashable, order-independent key.
+    """
+    return tuple(sorted(set(words)))
+
+
+class QueryPlanner():
+    """Lazily plans search queries from groups of alternative terms.
+
+    Every query combines one term of each group. Queries are yielded best-first by the product of
+    their term weights, so original terms come before low-relevance synonyms. Combinations are
+    enumerated on demand from a priority frontier instead of a materialized Cartesian product, and
+    queries that normalize to an already planned query are skipped.
+    """
+    def __init__(self, term_groups, max_queries=None):
+        """
+        Args:
+            term_groups (list of lists): Per position, the alternative terms as strings (weight 1.0)
+                or (term, weight) tuples.
+            max_queries (int): Maximum number of queries to yield, None for all.
+        """
+        self.groups = [self._prepare_group(group) for group in term_groups]
+        self.max_queries = max_queries
+
+    def _prepare_group(self, group):
+        """Normalizes a term group, merging equivalent terms and sorting by weight.
+
+        Args:
+            group (list): Terms as strings or (term, weight) tuples.
+
+        Returns:
+            A list of (words, weight) tuples, highest weight first.
+        """
+        best = {}
+        for term in group:
+            text, weight = (term, 1.0) if isinstance(term, str) else term
+            words = normalize_words(text)
+            if not words:
+                continue
+            key = query_key(words)
+            if key not in best or weight > best[key][1]:
+                best[key] = (words, weight)
+        return sorted(best.values(), key=lambda term: -term[1])
+
+    def upper_bound(self):
+        """Counts the combinations before deduplication.
+
+        Returns:
+            The size of the combination space, capped at max_queries.
+        """
+        total = 1
+        for group in self.groups:
+            total *= len(group)
+        if self.max_queries is not None:
+            total = min(total, self.max_queries)
+        return total
+
+    def estimate_cost(self, calls_per_query):
+        """Estimates the API calls needed to run the planned queries.
+
+        Uses the upper bound of the plan, since duplicates are only known while enumerating.
+
+        Args:
+            calls_per_query (dict): API calls per query for each provider, e.g. pages requested.
+
+        Returns:
+            A dict with the estimated calls per provider and their 'total'.
+        """
+        queries = self.upper_bound()
+        cost = {provider: queries * calls for provider, calls in calls_per_query.items()}
+        cost['total'] = sum(cost.values())
+        return cost
+
+    def __iter__(self):
+        """Yields normalized, deduplicated queries, highest weight first.
+
+        Yields:
+            (query, weight) tuples.
+        """
+        if not self.groups or any(not group for group in self.groups):
+            return
+
+        start = (0,) * len(self.groups)
+        frontier = [(-self._weight(start), start)]
+        seen = {start}
+        planned = set()
+        yielded = 0
+
+        while frontier and (self.max_queries is None or yielded < self.max_queries):
+            neg_weight, indices = heapq.heappop(frontier)
+            for pos in range(len(indices)):
+                if indices[pos] + 1 < len(self.groups[pos]):
+                    successor = indices[:pos] + (indices[pos] + 1,) + indices[pos + 1:]
+                    if successor not in seen:
+                        seen.add(successor)
+                        heapq.heappush(frontier, (-self._weight(successor), successor))
+
+            words = []
+            for group, idx in zip(self.groups, indices):
+                words += [word for word in group[idx][0] if word not in words]
+            key = query_key(words)
+            if key in planned:
+                continue
+            planned.add(key)
+            yielded += 1
+            yield ' '.join(words), -neg_weight
+
+    def _weight(self, indices):
+        """Computes the weight of a combination.
+
+        Args:
+            indices (tuple of ints): The term index within every group.
+
+        Returns:
+            The product of the term weights.
+        """
+        weight = 1.0
+        for group, idx in zip(self.groups, indices):
+            weight *= group[idx][1]
+        return weight
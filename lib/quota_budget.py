@@ -0,0 +1,172 @@
+import heapq
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+
+class QuotaBudget():
+    """Persistent per-provider API call budget.
+
+    Calls are counted per UTC day and month in SQLite, so the quota used by earlier runs is known
+    before the first request. Calls beyond a limit are refused instead of being sent, which lets
+    callers skip work gracefully rather than running into quota errors from the API.
+    """
+    def __init__(self, db_path):
+        """
+        Args:
+            db_path (string): Path of the SQLite budget file, created if it does not exist.
+        """
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.limits = {}
+        self.last_call = {}
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS usage (
+                provider TEXT NOT NULL,
+                period TEXT NOT NULL,
+                calls INTEGER NOT NULL,
+                PRIMARY KEY (provider, period)
+            )''')
+        self.conn.commit()
+
+    def set_limits(self, provider, daily=None, monthly=None, per_second=None, cost_per_call=0.0):
+        """Configures the quota of a provider. Providers without limits are never refused.
+
+        Args:
+            provider (string): Name of the API.
+            daily (int): Maximum number of calls per UTC day, None for no limit.
+            monthly (int): Maximum number of calls per UTC month, None for no limit.
+            per_second (float): Maximum call rate, calls are delayed to stay below it.
+            cost_per_call (float): Price of a single call, used to report the spend.
+        """
+        self.limits[provider] = {'daily': daily, 'monthly': monthly, 'per_second': per_second,
+                                 'cost_per_call': cost_per_call}
+
+    def _periods(self):
+        """Gets the keys of the current UTC day and month."""
+        now = datetime.now(timezone.utc)
+        return now.strftime('%Y-%m-%d'), now.strftime('%Y-%m')
+
+    def _calls(self, provider, period):
+        """Reads the calls of a provider in a period. Caller must hold the lock."""
+        row = self.conn.execute('SELECT calls FROM usage WHERE provider = ? AND period = ?',
+                                (provider, period)).fetchone()
+        return row[0] if row else 0
+
+    def _remaining(self, provider):
+        """Computes the calls left today and this month. Caller must hold the lock."""
+        limits = self.limits.get(provider, {})
+        day, month = self._periods()
+        remaining = []
+        if limits.get('daily') is not None:
+            remaining.append(limits['daily'] - self._calls(provider, day))
+        if limits.get('monthly') is not None:
+            remaining.append(limits['monthly'] - self._calls(provider, month))
+        return max(min(remaining), 0) if remaining else None
+
+    def remaining(self, provider):
+        """Gets the number of calls a provider has left.
+
+        Args:
+            provider (string): Name of the API.
+
+        Returns:
+            The calls left under the tightest of the daily and monthly limits, None if unlimited.
+        """
+        with self.lock:
+            return self._remaining(provider)
+
+    def exhausted(self, provider):
+        """Checks whether a provider has no calls left.
+
+        Args:
+            provider (string): Name of the API.
+
+        Returns:
+            True if no further calls are allowed until the quota resets.
+        """
+        return self.remaining(provider) == 0
+
+    def acquire(self, provider):
+        """Books a call, delaying it if needed to respect the rate limit.
+
+        Args:
+            provider (string): Name of the API.
+
+        Returns:
+            True if the call may be made, False if the quota is used up.
+        """
+        with self.lock:
+            if self._remaining(provider) == 0:
+                return False
+            slot = time.monotonic()
+            per_second = self.limits.get(provider, {}).get('per_second')
+            if per_second:
+                # Reserving the slot spaces out concurrent calls without sleeping under the shared lock
+                slot = max(self.last_call.get(provider, 0) + 1 / per_second, slot)
+                self.last_call[provider] = slot
+            with self.conn:
+                for period in self._periods():
+                    self.conn.execute('INSERT INTO usage VALUES (?, ?, 1) ON CONFLICT (provider, period) '
+                                      'DO UPDATE SET calls = calls + 1', (provider, period))
+        wait = slot - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        return True
+
+    def usage(self, provider):
+        """Summarizes the calls and spend of a provider in the current periods.
+
+        Args:
+            provider (string): Name of the API.
+
+        Returns:
+            A dict with the calls 'today' and 'this_month', the 'remaining' calls and the monthly 'spend'.
+        """
+        day, month = self._periods()
+        with self.lock:
+            today, this_month = self._calls(provider, day), self._calls(provider, month)
+            remaining = self._remaining(provider)
+        cost = self.limits.get(provider, {}).get('cost_per_call', 0.0)
+        return {'today': today, 'this_month': this_month, 'remaining': remaining, 'spend': this_month * cost}
+
+    def close(self):
+        """Closes the database connection."""
+        with self.lock:
+            self.conn.close()
+
+
+def plan_pages(weighted_queries, remaining_calls, max_pages, page_decay=0.5):
+    """Spreads a provider's remaining calls over the queries, maximizing the expected new images.
+
+    Every result page costs one call. Its expected yield of new images is the query weight, reduced
+    by page_decay for every earlier page of the same query, since later pages are less relevant and
+    overlap more with what was already stored. Pages are picked greedily by expected yield, so a
+    short budget goes to the first pages of the best queries instead of stopping halfway the list.
+
+    Args:
+        weighted_queries (list of tuples): (query, weight) tuples, e.g. from a QueryPlanner.
+        remaining_calls (int): Number of search calls left, None for no limit.
+        max_pages (int): Maximum number of pages per query, e.g. 10 for Google's 100 results.
+        page_decay (float): Yield of a page relative to the page before it.
+
+    Returns:
+        A dict mapping every query to its number of pages, 0 for queries left out.
+    """
+    pages = {query: 0 for query, _ in weighted_queries}
+    if remaining_calls is None:
+        return {query: max_pages for query in pages}
+
+    frontier = [(-weight, position, query) for position, (query, weight) in enumerate(weighted_queries)]
+    heapq.heapify(frontier)
+    calls = 0
+    while frontier and calls < remaining_calls:
+        neg_yield, position, query = heapq.heappop(frontier)
+        pages[query] += 1
+        calls += 1
+        if pages[query] < max_pages:
+            heapq.heappush(frontier, (neg_yield * page_decay, position, query))
+    return pages
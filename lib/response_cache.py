@@ -0,0 +1,108 @@
+import json
+import sqlite3
+import threading
+import time
+import zlib
+
+# Parameters that are either secret or already part of the cache key
+IGNORED_PARAMS = {'key', 'api_key', 'q', 'text', 'start', 'offset', 'page'}
+
+
+def normalize_query(query):
+    """Normalizes a query so trivially different spellings share a cache entry.
+
+    Args:
+        query (string): Image search query.
+
+    Returns:
+        The lowercased query with collapsed whitespace.
+    """
+    return ' '.join(query.lower().split())
+
+def params_key(params):
+    """Serializes the request parameters that influence the results.
+
+    Args:
+        params (dict): The request parameters.
+
+    Returns:
+        A canonical JSON string of the remaining parameters.
+    """
+    relevant = {k: str(v) for k, v in (params or {}).items() if k not in IGNORED_PARAMS}
+    return json.dumps(relevant, sort_keys=True)
+
+
+class ResponseCache():
+    """Compressed store of parsed search responses.
+
+    Responses are stored as zlib-compressed JSON, indexed by (provider, normalized query, offset,
+    params). Fresh entries are served instead of repeating the API call; expired entries can still be
+    replayed to redrive image downloads without any API calls.
+    """
+    def __init__(self, db_path, ttl=7 * 24 * 3600):
+        """
+        Args:
+            db_path (string): Path of the SQLite cache file, created if it does not exist.
+            ttl (float): Number of seconds a cached response counts as fresh, None to never expire.
+        """
+        self.db_path = db_path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                provider TEXT NOT NULL,
+                query TEXT NOT NULL,
+                offset INTEGER NOT NULL,
+                params TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                body BLOB NOT NULL,
+                PRIMARY KEY (provider, query, offset, params)
+            )''')
+        self.conn.commit()
+
+    def get(self, provider, query, offset, params, fresh_only=True):
+        """Looks up a cached response.
+
+        Args:
+            provider (string): Name of the API.
+            query (string): Image search query.
+            offset (int): Result offset of the request.
+            params (dict): The request parameters.
+            fresh_only (bool): Ignore entries older than the TTL.
+
+        Returns:
+            The parsed response, or None on a miss.
+        """
+        with self.lock:
+            row = self.conn.execute('SELECT fetched_at, body FROM responses '
+                                    'WHERE provider = ? AND query = ? AND offset = ? AND params = ?',
+                                    (provider, normalize_query(query), offset, params_key(params))).fetchone()
+        if row is None:
+            return None
+        fetched_at, body = row
+        if fresh_only and self.ttl is not None and time.time() - fetched_at > self.ttl:
+            return None
+        return json.loads(zlib.decompress(body))
+
+    def put(self, provider, query, offset, params, response):
+        """Stores a parsed response.
+
+        Args:
+            provider (string): Name of the API.
+            query (string): Image search query.
+            offset (int): Result offset of the request.
+            params (dict): The request parameters.
+            response (dict): The parsed JSON response.
+        """
+        body = zlib.compress(json.dumps(response, separators=(',', ':')).encode('utf-8'))
+        with self.lock:
+            self.conn.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)',
+                              (provider, normalize_query(query), offset, params_key(params), time.time(), body))
+            self.conn.commit()
+
+    def close(self):
+        """Closes the database connection."""
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,123 @@
+import threading
+import time
+
+
+class ProviderLane():
+    """Work lane running all queries against a single API caller.
+
+    Keeps its own progress counters, so a lane that errors out or waits on rate limiting does not
+    affect the lanes of other providers.
+    """
+    def __init__(self, api_caller, pages):
+        """
+        Args:
+            api_caller (APICaller): The caller to submit queries to.
+            pages (int or dict): Number of result pages to request per query, or a dict mapping every
+                query to its pages, e.g. from plan_pages. Queries planned with 0 pages are skipped.
+        """
+        self.api_caller = api_caller
+        self.pages = pages
+
+        self.queries_done = 0
+        self.queries_total = 0
+        self.images_saved = 0
+        self.errors = 0
+        self.finished = False
+        self.started_at = None
+        self.finished_at = None
+
+    def run(self, queries, search_grouping):
+        """Submits every query to the caller, prefetching its pages until results run out.
+
+        Args:
+            queries (list of strings): Image search queries to search for.
+            search_grouping (string): Folder grouping for search results.
+        """
+        self.queries_total = len(queries)
+        self.started_at = time.time()
+        try:
+            for query in queries:
+                if self.api_caller.error_code:
+                    print(f"Stopping {self.api_caller.source} lane, error code {self.api_caller.error_code}")
+                    break
+                pages = self.pages.get(query, 0) if isinstance(self.pages, dict) else self.pages
+                if not pages:
+                    self.queries_done += 1
+                    continue
+                try:
+                    self.images_saved += self.api_caller.download_pages(query, search_grouping, pages)
+                except Exception as e:
+                    self.errors += 1
+                    print(f"Query '{query}' failed for {self.api_caller.source}\n{str(e)}\n")
+                self.queries_done += 1
+        finally:
+            self.finished = True
+            self.finished_at = time.time()
+
+    def progress(self):
+        """Summarizes the lane's progress.
+
+        Returns:
+            A single-line progress description.
+        """
+        elapsed = (self.finished_at or time.time()) - (self.started_at or time.time())
+        status = 'done' if self.finished else 'running'
+        if self.api_caller.error_code:
+            status = f'stopped ({self.api_caller.error_code})'
+        elif self.api_caller.budget_exhausted():
+            status += ', budget used up' # Cached pages are still served
+        return (f"{self.api_caller.source}: {self.queries_done}/{self.queries_total} queries, "
+                f"{self.images_saved} images, {self.errors} errors, {elapsed:.0f}s, {status}")
+
+
+class QueryScheduler():
+    """Runs the same query list against several API callers concurrently.
+
+    Every caller gets its own lane thread, so total runtime approaches that of the slowest provider
+    instead of the sum of all providers.
+    """
+    def __init__(self, report_interval=30):
+        """
+        Args:
+            report_interval (float): Seconds between progress reports.
+        """
+        self.report_interval = report_interval
+        self.lanes = []
+
+    def add_provider(self, api_caller, pages=1):
+        """Adds a lane for an API caller.
+
+        Args:
+            api_caller (APICaller): The caller to submit queries to.
+            pages (int or dict): Number of result pages to request per query, or a dict mapping every
+                query to its pages.
+        """
+        self.lanes.append(ProviderLane(api_caller, pages))
+
+    def run(self, queries, search_grouping):
+        """Runs all lanes and blocks until every lane has finished.
+
+        Args:
+            queries (list of strings): Image search queries to search for.
+            search_grouping (string): Folder grouping for search results.
+
+        Returns:
+            The lanes, holding the final progress counters.
+        """
+        queries = list(queries)
+        threads = [threading.Thread(target=lane.run, args=(queries, search_grouping), daemon=True)
+                   for lane in self.lanes]
+        for thread in threads:
+            thread.start()
+
+        running = threads
+        while running:
+            running[0].join(timeout=self.report_interval)
+            running = [thread for thread in running if thread.is_alive()]
+            self.report()
+        return self.lanes
+
+    def report(self):
+        """Prints the progress of every lane."""
+        for lane in self.lanes:
+            print(lane.progress())
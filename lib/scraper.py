@@ -1,22 +1,44 @@
 import io
 from io import BytesIO
 import os.path
-import pickle
 import time
-import requests
 
 import urllib
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
 
 from data_management.thesaurusScraper import thesaurus as th
 from data_management import data_funcs
+from data_management.pipeline import StagedPipeline
+from data_management import transport as tp
+from data_management.dedup_index import content_hash
+from data_management.job_journal import DONE, FAILED, EXHAUSTED
+from data_management.metrics import get_default_metrics
+from data_management.image_sniff import read_image_stream, ImageRejected
+
+JPEG_SOI = b'\xff\xd8\xff' # Start of image marker, followed by the first segment marker
+JPEG_EOI = b'\xff\xd9'
+
+# Flickr size suffixes, ordered like the size nodes returned by flickr.photos.getSizes
+FLICKR_SIZE_SUFFIXES = ['sq', 'q', 't', 's', 'n', 'w', 'm', 'z', 'c', 'l', 'h', 'k', '3k', '4k', 'f', '5k', '6k', 'o']
 
 class APICaller():
     """General API image searching wrapper.
 
-    Base class containing common functionality between image search APIs.
+    Base class containing common functionality between image search APIs. Every API subclass
+    implements:
+        search_page(query, page): Retrieves a page of search results, returning the parsed
+            results or None if they could not be retrieved.
+        _download_results(search_results, query, page, search_grouping): Downloads the images
+            of a page of search results, returning the number of images saved.
+        _is_exhausted(search_results, page): Checks whether a page is the last one with results,
+            so requesting further pages is pointless.
     """
-    def __init__(self, source, rest_url, api_key, data_root, images_per_req):
+    def __init__(self, source, rest_url, api_key, data_root, images_per_req,
+                 fetch_workers=8, decode_workers=2, write_workers=2, queue_size=16, transport=None,
+                 image_retries=1, dedup_index=None, journal=None, response_cache=None, replay=False,
+                 passthrough_jpeg=True, normalizer=None, metrics=None, max_image_bytes=20 * 1024 * 1024,
+                 max_image_pixels=50 * 1000 * 1000, max_image_side=None, budget=None):
         """
         Args:
             source (string): Description for saving purposes.
@@ -24,6 +46,27 @@ class APICaller():
             api_key(string): The API key supplied for the API.
             data_root (string): The output path.
             images_per_req (int): The total amount of items to return per search.
+            fetch_workers (int): Number of threads downloading images concurrently.
+            decode_workers (int): Number of threads decoding and validating downloaded images.
+            write_workers (int): Number of threads writing images to disk.
+            queue_size (int): Maximum number of images waiting in front of each pipeline stage.
+            transport (HttpTransport): HTTP layer for all calls, defaults to the shared transport.
+            image_retries (int): Number of retries for a failed image download.
+            dedup_index (DedupIndex): Shared index used to skip known URLs and identical payloads.
+            journal (JobJournal): Journal used to skip work completed by an interrupted run.
+            response_cache (ResponseCache): Store serving fresh search responses without API calls.
+            replay (bool): Only serve search responses from the cache, regardless of their age, so
+                image downloads are redriven without any API calls.
+            passthrough_jpeg (bool): Write valid JPEG payloads to disk as downloaded instead of
+                decoding and re-encoding them.
+            normalizer (ImageNormalizer): Resizes and re-encodes every image before it is saved.
+            metrics (Metrics): Collects stage timings and counters, defaults to the shared metrics.
+            max_image_bytes (int): Downloads are aborted beyond this many bytes, None for no limit.
+            max_image_pixels (int): Images with more pixels are aborted once their header arrives,
+                None for no limit.
+            max_image_side (int): Images with a longer side are aborted once their header arrives,
+                None for no limit.
+            budget (QuotaBudget): Persistent call quota, API calls beyond it are skipped.
         """        
         self.rest_url = rest_url
         self.source = source
@@ -31,27 +74,341 @@ class APICaller():
         self.data_root = data_root
         self.images_per_req = images_per_req # Max number of returns allowed per call
 
+        self.fetch_workers = fetch_workers
+        self.decode_workers = decode_workers
+        self.write_workers = write_workers
+        self.queue_size = queue_size
+        self.transport = transport if transport else tp.get_default_transport()
+        self.image_retries = image_retries
+        self.dedup_index = dedup_index
+        self.journal = journal
+        self.response_cache = response_cache
+        self.replay = replay
+        self.passthrough_jpeg = passthrough_jpeg
+        self.normalizer = normalizer
+        self.metrics = metrics if metrics else get_default_metrics()
+        self.max_image_bytes = max_image_bytes
+        self.max_image_pixels = max_image_pixels
+        self.max_image_side = max_image_side
+        self.budget = budget
+
         self.error_code = None
 
-    def _save_image_file(self, image_bytes, path):
-        """Saves a bytes object to a specified target location.
+    def download_images(self, query, page, search_grouping):
+        """Searches a single page of results and downloads its images.
+
+        Args:
+            query (string): Image search query to search for.
+            page (int): The page index to start from.
+            search_grouping (string): Folder grouping for search results.
+
+        Returns:
+            The number of images saved, or None if the page could not be searched.
+        """
+        if self.error_code:
+            return None # Prevent repeated API calls when error is received
+        if self._search_completed(query, page):
+            return 0
+        search_results = self.search_page(query, page)
+        if search_results is None:
+            return None
+        return self._download_results(search_results, query, page, search_grouping)
+
+    def download_pages(self, query, search_grouping, max_pages):
+        """Searches consecutive pages of results and downloads their images.
+
+        The next page is searched in the background while the images of the current page download.
+        A page is only requested once the previous one showed more results exist, so exhausted result
+        sets cost no extra API calls.
+
+        Args:
+            query (string): Image search query to search for.
+            search_grouping (string): Folder grouping for search results.
+            max_pages (int): Maximum number of pages to retrieve.
+
+        Returns:
+            The number of images saved.
+        """
+        saved = 0
+        with ThreadPoolExecutor(max_workers=1) as prefetcher:
+            next_search = self._prefetch_page(prefetcher, query, 0)
+            for page in range(max_pages):
+                search_results = next_search.result() if next_search else None
+                next_search = None
+                exhausted = search_results is not None and self._is_exhausted(search_results, page)
+                if not exhausted and page + 1 < max_pages:
+                    next_search = self._prefetch_page(prefetcher, query, page + 1)
+
+                if search_results is not None:
+                    saved += self._download_results(search_results, query, page, search_grouping) or 0
+                if exhausted:
+                    for later_page in range(page + 1, max_pages):
+                        self._record_search(query, later_page, EXHAUSTED)
+                    break
+        return saved
+
+    def _prefetch_page(self, prefetcher, query, page):
+        """Starts searching a page in the background, unless it is not needed.
+
+        Args:
+            prefetcher (ThreadPoolExecutor): Executor running the search.
+            query (string): Image search query to search for.
+            page (int): The page index to search.
+
+        Returns:
+            A future for the search results, or None if the page is skipped.
+        """
+        if self.error_code or self._search_completed(query, page):
+            return None
+        return prefetcher.submit(self.search_page, query, page)
+
+    def _run_download_pipeline(self, jobs, query, page):
+        """Downloads, decodes and saves images concurrently.
+
+        Each job moves through a fetch, decode and write stage. The stages are connected by bounded
+        queues, so slow image hosts only hold up their own fetch worker.
+
+        Args:
+            jobs (iterable of dicts): Jobs with the image 'url' and the output 'path'. May be a
+                generator that performs further lookups per image.
+            query (string): The search query the jobs resulted from.
+            page (int): The page index the jobs resulted from.
+
+        Returns:
+            The number of images saved.
+        """
+        decode_workers = self.decode_workers
+        if self.normalizer:
+            decode_workers = max(decode_workers, self.normalizer.processes) # Keep every process busy
+        pipeline = StagedPipeline([('fetch', self._fetch_image, self.fetch_workers),
+                                   ('decode', self._decode_image, decode_workers),
+                                   ('write', self._write_image, self.write_workers)],
+                                  queue_size=self.queue_size)
+        saved = pipeline.run(self._prepare_job(job, query) for job in jobs)
+        self._record_search(query, page, DONE)
+        return saved
+
+    def _prepare_job(self, job, query):
+        """Adds the query to a download job and matches its path to the output format.
+
+        Args:
+            job (dict): Download job with the image 'url' and the output 'path'.
+            query (string): The search query the job resulted from.
+
+        Returns:
+            The completed download job.
+        """
+        job = {**job, 'query': query}
+        if self.normalizer:
+            job['path'] = os.path.splitext(job['path'])[0] + self.normalizer.extension
+        return job
+
+    def _search_completed(self, query, page):
+        """Checks the journal for a search page finished by an earlier run.
+
+        Args:
+            query (string): Image search query.
+            page (int): The page index.
+
+        Returns:
+            True if the page and all of its images were already processed.
+        """
+        return bool(self.journal) and self.journal.search_done(self.source, query, page)
+
+    def _record_search(self, query, page, status):
+        """Journals the outcome of a search page, if a journal is used.
+
+        Args:
+            query (string): Image search query.
+            page (int): The page index.
+            status (string): The journal status of the page.
+        """
+        if self.journal:
+            self.journal.record_search(self.source, query, page, status)
+
+    def _record_url(self, job, status):
+        """Journals the outcome of an image download, if a journal is used.
+
+        Args:
+            job (dict): The download job.
+            status (string): The journal status of the image URL.
+        """
+        if self.journal:
+            self.journal.record_url(self.source, job['query'], job['url'], status)
+
+    def _fetch_image(self, job):
+        """Pipeline stage downloading the image bytes of a job.
+
+        The body is streamed, so non-images and images beyond the size caps are aborted after their
+        first bytes instead of being buffered completely.
+
+        Args:
+            job (dict): Download job containing the image 'url'.
+
+        Returns:
+            The job with the downloaded 'data', or None if the image could not be retrieved or was
+            downloaded before.
+        """
+        if self.dedup_index: # Checked before the journal, so every (provider, query) hit is recorded
+            known_hash = self.dedup_index.seen_url(job['url'])
+            if known_hash:
+                self.dedup_index.add_hit(known_hash, job['url'], self.source, job['query'])
+                self._record_url(job, DONE)
+                self.metrics.incr('duplicates', provider=self.source, kind='url')
+                return None
+        if self.journal and self.journal.url_done(job['url']):
+            self.metrics.incr('skipped_journaled', provider=self.source)
+            return None
+        try:
+            with self.metrics.timer('fetch', provider=self.source):
+                image_bytes = self.transport.get(job['url'], max_retries=self.image_retries, timeout=10, stream=True)
+                with image_bytes:
+                    if not image_bytes:
+                        self._image_failed(job, 'http_status')
+                        return None # Error status codes are skipped silently
+                    job['data'] = read_image_stream(image_bytes, self.max_image_bytes,
+                                                    self.max_image_pixels, self.max_image_side)
+        except ImageRejected as e:
+            print(f"Rejected image: {job['url']}\n{str(e)}\n")
+            self._image_failed(job, 'rejected')
+            return None
+        except Exception as e:
+            print(f"Unreachable URL: {job['url']}\n{str(e)}\n")
+            self._image_failed(job, 'unreachable')
+            return None
+        self.metrics.incr('fetch_bytes', len(job['data']), provider=self.source)
+        return job
+
+    def _decode_image(self, job):
+        """Pipeline stage decoding the downloaded bytes into an image.
+
+        Valid JPEG payloads skip decoding and keep their 'data' for the write stage, which saves
+        them unchanged. With a normalizer, every payload is replaced by its normalized encoding.
 
         Args:
-            image_bytes (byte): An image object.
-            path (string): Output path for the image object.
-        """          
-        with io.BytesIO(image_bytes.content) as f:
-            f.seek(0)
-            with Image.open(f) as img:
-                if img.format in ['JPEG', 'TIFF']:
-                    exif = img._getexif()
-                    if exif and exif != {}:
-                        img.save(path, 'JPEG', exif=img.info['exif'])
+            job (dict): Download job containing the image 'data'.
+
+        Returns:
+            The job with the decoded 'image' and its 'exif' bytes, or None if decoding failed or an
+            identical payload is already stored.
+        """
+        if self.dedup_index:
+            job['hash'] = content_hash(job['data'])
+            if not self.dedup_index.claim(job['hash'], job['path']):
+                self.dedup_index.add_hit(job['hash'], job['url'], self.source, job['query'])
+                self._record_url(job, DONE)
+                self.metrics.incr('duplicates', provider=self.source, kind='content')
+                return None
+        if self.normalizer:
+            try:
+                with self.metrics.timer('normalize', provider=self.source):
+                    job['data'] = self.normalizer.normalize(job['data'])
+            except Exception as e:
+                print(f"Unsaveable image: {job['url']}\n{str(e)}\n")
+                self._image_failed(job, 'normalize')
+                return None
+            return job
+        with self.metrics.timer('validate', provider=self.source):
+            passthrough = self.passthrough_jpeg and self._is_valid_jpeg(job['data'])
+        if passthrough:
+            return job
+        try:
+            with self.metrics.timer('decode', provider=self.source), io.BytesIO(job.pop('data')) as f:
+                with Image.open(f) as img:
+                    img.load()
+                    exif = None
+                    if img.format in ['JPEG', 'TIFF']:
+                        if img._getexif():
+                            exif = img.info['exif']
+                        job['image'] = img.copy()
                     else:
-                        img.save(path, 'JPEG')
-                else:
-                    img = img.convert('RGB')
-                    img.save(path, 'JPEG')
+                        job['image'] = img.convert('RGB')
+            job['exif'] = exif
+        except Exception as e:
+            print(f"Unsaveable image: {job['url']}\n{str(e)}\n")
+            self._image_failed(job, 'decode')
+            return None
+        return job
+
+    def _write_image(self, job):
+        """Pipeline stage writing an image to its output path.
+
+        Args:
+            job (dict): Download job containing either the decoded 'image' or passthrough 'data',
+                and the output 'path'.
+
+        Returns:
+            The job, or None if the image could not be saved.
+        """
+        try:
+            if 'image' in job: # Encoded apart from the write, so PIL and disk time are told apart
+                with self.metrics.timer('encode', provider=self.source):
+                    job['data'] = self._encode_image(job.pop('image'), job['exif'])
+            with self.metrics.timer('write', provider=self.source), open(job['path'], 'wb') as f:
+                f.write(job.pop('data'))
+        except Exception as e:
+            print(f"Unsaveable image: {job['url']}\n{str(e)}\n")
+            self._image_failed(job, 'write')
+            return None
+        if self.dedup_index:
+            self.dedup_index.add_hit(job['hash'], job['url'], self.source, job['query'])
+        self._record_url(job, DONE)
+        self.metrics.incr('images_saved', provider=self.source)
+        return job
+
+    def _is_valid_jpeg(self, image_bytes):
+        """Cheaply checks whether a payload is a complete JPEG without decoding the pixel data.
+
+        Args:
+            image_bytes (bytes): The downloaded payload.
+
+        Returns:
+            True if the payload has JPEG start and end markers and a parseable header.
+        """
+        if not image_bytes.startswith(JPEG_SOI) or JPEG_EOI not in image_bytes[-64:]:
+            return False
+        try:
+            with Image.open(io.BytesIO(image_bytes)) as img: # Only parses the header segments
+                return img.format == 'JPEG' and img.width > 0 and img.height > 0
+        except Exception:
+            return False
+
+    def _image_failed(self, job, error_type):
+        """Books a failed download job: frees its hash claim, journals and counts the failure.
+
+        Args:
+            job (dict): The failed download job.
+            error_type (string): Short description of the failure for the error counters.
+        """
+        self._release_claim(job)
+        self._record_url(job, FAILED)
+        self.metrics.incr('errors', provider=self.source, type=error_type)
+
+    def _release_claim(self, job):
+        """Frees the content hash claimed for a job that failed, so a later copy can be stored.
+
+        Args:
+            job (dict): Download job that may hold a claimed 'hash'.
+        """
+        if self.dedup_index and 'hash' in job:
+            self.dedup_index.release(job['hash'])
+
+    def _encode_image(self, img, exif=None):
+        """Encodes an image object as JPEG in memory.
+
+        Args:
+            img (PIL.Image): A decoded image object.
+            exif (bytes): Raw EXIF data to pass through, if any.
+
+        Returns:
+            The JPEG bytes.
+        """
+        with BytesIO() as f:
+            if exif:
+                img.save(f, 'JPEG', exif=exif)
+            else:
+                img.save(f, 'JPEG')
+            return f.getvalue()
 
     def _construct_output_dir(self, search_grouping, query):
         """Creates a directory path for a search.
@@ -65,15 +422,66 @@ class APICaller():
         """        
         return(os.path.join(self.data_root, search_grouping, self.source, query))
 
-    def _store_response(self, response, pickle_file):
-        """Pickles a response file for later processing.
+    def budget_exhausted(self):
+        """Checks whether the call quota of this API is used up.
+
+        Returns:
+            True if a budget is set and no calls are left until it resets.
+        """
+        return bool(self.budget) and self.budget.exhausted(self.source)
+
+    def _search(self, query, page, offset, params, request):
+        """Retrieves a page of search results, from the response cache if possible.
+
+        Args:
+            query (string): Image search query.
+            page (int): The page index.
+            offset (int): Result offset of the page.
+            params (dict): The request parameters, used as part of the cache key.
+            request (function): Performs the API call and returns the response.
+
+        Returns:
+            The parsed search results, or None if they could not be retrieved.
+        """
+        search_results = self._cached_request(query, offset, params, request)
+        if search_results is None and not self.budget_exhausted(): # Pages skipped for quota are left for a later run
+            self._record_search(query, page, FAILED)
+        return search_results
+
+    def _cached_request(self, key, offset, params, request):
+        """Serves an API call from the response cache, or performs and caches it.
 
         Args:
-            response (dict): Response object retrieved from API.
-            pickle_file: File path of the pickle to save.
-        """                
-        with open(pickle_file, 'wb') as p:
-            pickle.dump(response, p, protocol=pickle.HIGHEST_PROTOCOL)
+            key (string): Query part of the cache key.
+            offset (int): Result offset of the request.
+            params (dict): The request parameters.
+            request (function): Performs the API call and returns the response.
+
+        Returns:
+            The parsed JSON response, or None on an error status or a cache miss in replay mode.
+        """
+        if self.response_cache:
+            cached = self.response_cache.get(self.source, key, offset, params, fresh_only=not self.replay)
+            if cached is not None:
+                self.metrics.incr('search_cache_hits', provider=self.source)
+                return cached
+        if self.replay:
+            print(f"No cached {self.source} response for '{key}' at offset {offset}, skipping")
+            return None
+        if self.budget and not self.budget.acquire(self.source):
+            self.metrics.incr('budget_refused', provider=self.source)
+            return None
+
+        with self.metrics.timer('search', provider=self.source):
+            response = request()
+        self.metrics.incr('api_calls', provider=self.source)
+        if not self._check_status_code(response.status_code):
+            self.metrics.incr('errors', provider=self.source, type=f'api_status_{response.status_code}')
+            return None
+        results = response.json()
+        if self.response_cache:
+            self.response_cache.put(self.source, key, offset, params, results)
+        return results
 
     def _assert_offset(self, page, imgs_per_req):
         """Determines the starting index based on the page and the number of requests
@@ -91,12 +499,23 @@ class APICaller():
     def _check_status_code(self, status_code):
         """Check if the last run resulted in an error code from the API.
 
+        Fatal errors (e.g. an invalid or blocked key) stop the caller for the rest of the run. Other
+        errors have already been retried by the transport and only skip the current request.
+
         Args:
             status_code (int): The status code returned by the API call.
+
+        Returns:
+            True if the response can be processed.
         """        
-        if status_code != 200:
+        if status_code == 200:
+            return True
+        if tp.is_fatal(status_code):
             self.error_code = status_code
             print(f'aborting further execution, error code {status_code} received for {self.source} caller')
+        else:
+            print(f'skipping request, error code {status_code} received for {self.source} caller')
+        return False
     
     def _check_if_key_in_dict(self, key, results):
         """Check whether a given key exists in a dictionary.
@@ -118,19 +537,17 @@ class GoogleCaller(APICaller):
     See the following link for a more extensive overview of the set-up:
     https://stackoverflow.com/questions/34035422/google-image-search-says-api-no-longer-available
     """
-    def __init__(self, api_key, data_root, returns_per_req, cx):
+    def __init__(self, api_key, data_root, returns_per_req, cx, **kwargs):
         super().__init__('google',
                          'https://www.googleapis.com/customsearch/v1',
                          api_key,
                          data_root,
-                         returns_per_req)
+                         returns_per_req,
+                         **kwargs)
         self.cx = cx
         self.img_size = 'medium'
 
-    def download_images(self, query, page, search_grouping):
-        if self.error_code:
-            return 0 # Prevent repeated API calls when error is received
-
+    def search_page(self, query, page):
         offset = self._assert_offset(page, self.images_per_req)
         params  = { 'key': self.key,
                     'gl':'uk',
@@ -146,34 +563,27 @@ class GoogleCaller(APICaller):
         if offset > 0:
             params['start'] = offset # Offset must be between 1 and 90
 
-        response = requests.get(self.rest_url, params=params)
-        self._check_status_code(response.status_code)
+        return self._search(query, page, offset, params,
+                            lambda: self.transport.get(self.rest_url, params=params))
 
-        search_results = response.json()
-        
+    def _is_exhausted(self, search_results, page):
+        if not search_results.get('items') or 'nextPage' not in search_results.get('queries', {}):
+            return True
+        return (page + 2) * self.images_per_req > 100 # The API returns at most 100 results per query
+
+    def _download_results(self, search_results, query, page, search_grouping):
         out_dir = self._construct_output_dir(search_grouping, query)
         data_funcs.create_dir_if_not_exist(out_dir)
 
-        response_pickle = out_dir + f'/{query}_{self.img_size}_{offset}.pickle'
-        self._store_response(response, response_pickle)
-
         if self._check_if_key_in_dict('items',search_results) == False:
+            self._record_search(query, page, DONE)
             return None
-        for i, search_result in enumerate(search_results['items']):
-            try:
-                image_bytes = requests.get(search_result['link'], timeout=10)
-            except Exception as e:
-                image_bytes = None
-                print(f"Unreachable URL: {search_result['link']}\n{str(e)}\n")
-
+        jobs = []
+        for search_result in search_results['items']:
             random_filename = data_funcs.generate_random_filename(length=10)
-            image_path = out_dir + f'/{random_filename}.jpg'
-
-            if image_bytes:
-                try:
-                    self._save_image_file(image_bytes, image_path)
-                except Exception as e:
-                    print(f"Unsaveable image: {search_result['link']}\n{str(e)}\n")
+            jobs.append({'url': search_result['link'],
+                         'path': out_dir + f'/{random_filename}.jpg'})
+        return self._run_download_pipeline(jobs, query, page)
 
 class BingCaller(APICaller):
     """Subclass for calling Google API calls & handling response.
@@ -181,17 +591,15 @@ class BingCaller(APICaller):
     See the following link for the API reference:
     https://docs.microsoft.com/en-us/rest/api/cognitiveservices/bing-images-api-v7-reference
     """
-    def __init__(self, api_key, data_root, returns_per_req):
+    def __init__(self, api_key, data_root, returns_per_req, **kwargs):
         super().__init__('bing',
                          'https://api.cognitive.microsoft.com/bing/v7.0/images/search',
                          api_key,
                          data_root,
-                         returns_per_req)
-
-    def download_images(self, query, page, search_grouping):
-        if self.error_code:
-            return None # Prevent repeated API calls when error is received        
+                         returns_per_req,
+                         **kwargs)
 
+    def search_page(self, query, page):
         offset = self._assert_offset(page, self.images_per_req)
         headers = {'Ocp-Apim-Subscription-Key' : self.key}
         params  = { 'q': query,
@@ -201,97 +609,102 @@ class BingCaller(APICaller):
                     'offset':offset
                 }
 
-        response = requests.get(self.rest_url, headers=headers, params=params)
-        self._check_status_code(response.status_code)
+        return self._search(query, page, offset, params,
+                            lambda: self.transport.get(self.rest_url, headers=headers, params=params))
 
-        if self.error_code:
-            return None # Prevent repeated API calls when error is received
+    def _is_exhausted(self, search_results, page):
+        results = search_results.get('value')
+        if not results:
+            return True
+        offset = self._assert_offset(page, self.images_per_req)
+        next_offset = search_results.get('nextOffset', offset + len(results))
+        total = search_results.get('totalEstimatedMatches')
+        return total is not None and next_offset >= total
 
-        search_results = response.json()        
-        
+    def _download_results(self, search_results, query, page, search_grouping):
         out_dir = self._construct_output_dir(search_grouping, query)
         data_funcs.create_dir_if_not_exist(out_dir)
 
-        response_pickle = out_dir + f'/{query}_{offset}.pickle'
-        self._store_response(response, response_pickle)
-
-        if self._check_if_key_in_dict('value',search_results) == False: return 0
-        for search_result in search_results['value']:
-            image_id = search_result['imageId']
-
-            try:
-                image_bytes = requests.get(search_result['contentUrl'], timeout=10)
-            except Exception as e:
-                image_bytes = None
-                print(f"Unreachable URL: {search_result['contentUrl']}\n{str(e)}\n")
-
-            image_path = out_dir + f'/{image_id}.jpg'
-
-            if image_bytes:
-                try:
-                    self._save_image_file(image_bytes, image_path)
-                except Exception as e:
-                    print(f"Unsaveable image: {search_result['contentUrl']}\n{str(e)}\n")
+        if self._check_if_key_in_dict('value',search_results) == False:
+            self._record_search(query, page, DONE)
+            return 0
+        jobs = [{'url': search_result['contentUrl'],
+                 'path': out_dir + f"/{search_result['imageId']}.jpg"}
+                for search_result in search_results['value']]
+        return self._run_download_pipeline(jobs, query, page)
 
 class FlickrCaller(APICaller):
     """Subclass for calling Flickr API calls & handling response.
 
-    Uses only the photo search API call and the image ID lookup. More info on params here:
+    Uses only the photo search API call and the image ID lookup. The search requests the size URLs
+    and download permission of every photo as extras, so the image ID lookup is only needed for
+    photos that lack them. More info on params here:
     https://www.flickr.com/services/api/flickr.photos.search.htm
     """     
-    def __init__(self, api_key, data_root, returns_per_req):
+    def __init__(self, api_key, data_root, returns_per_req, **kwargs):
         super().__init__('flickr',
                          'https://api.flickr.com/services/rest/?',
                          api_key,
                          data_root,
-                         returns_per_req)
-
-    def download_images(self, query, page, search_grouping):
-        if self.error_code:
-            return None # Prevent repeated API calls when error is received        
+                         returns_per_req,
+                         **kwargs)
 
+    def search_page(self, query, page):
         offset = self._assert_offset(page, self.images_per_req)
-        response = self.search_images(query, page)
-        self._check_status_code(response.status_code)
-        
+        return self._search(query, page, offset, self._search_params(query, page),
+                            lambda: self.search_images(query, page))
 
-        search_results = response.json()        
+    def _is_exhausted(self, search_results, page):
+        photos = search_results.get('photos')
+        if not photos or not photos.get('photo'):
+            return True
+        return int(photos.get('page', 0)) >= int(photos.get('pages', 0))
 
+    def _download_results(self, search_results, query, page, search_grouping):
         out_dir = self._construct_output_dir(search_grouping, query)
         data_funcs.create_dir_if_not_exist(out_dir)  
 
-        response_pickle = out_dir + f'/{query}_{offset}.pickle'
-        self._store_response(response, response_pickle)
-        
         if self._check_if_key_in_dict('photos',search_results) == False:
+            self._record_search(query, page, DONE)
             return None
 
-        photos = search_results['photos']['photo']            
-        for _,photo in enumerate(photos):
+        photos = search_results['photos']['photo']
+        return self._run_download_pipeline(self._photo_jobs(photos, out_dir), query, page)
+
+    def _photo_jobs(self, photos, out_dir):
+        """Determines the download URL of every photo, yielding download jobs as they resolve.
+
+        URLs come from the search extras. Photos without them are looked up with getSizes; this runs
+        as the producing stage of the download pipeline, so earlier photos are already being fetched
+        while later sizes are still being looked up.
+
+        Args:
+            photos (list of dicts): The photo entries of a search response.
+            out_dir (string): The output directory for the images.
+
+        Yields:
+            Download jobs with the image 'url' and the output 'path'.
+        """
+        for photo in photos:
             image_id = photo['id']
+            extras_url = self._get_extras_url(photo, resolution = 7)
+            if extras_url:
+                if int(photo['can_download']):
+                    yield {'url': extras_url,
+                           'path': out_dir + f'/{image_id}.jpg'}
+                continue
+
             sizes_response  = self.get_image_sizes(image_id)
+            if sizes_response is None:
+                continue
 
-            if self._check_if_key_in_dict('sizes',sizes_response.json()) != False:
-                img_sizes = sizes_response.json()['sizes']
+            if self._check_if_key_in_dict('sizes',sizes_response) != False:
+                img_sizes = sizes_response['sizes']
             
                 if not img_sizes['candownload'] == 0:
                     highest_res_url = self._get_image_url(img_sizes, resolution = 7)
-
-                    try:
-                        image_bytes = image_bytes = requests.get(highest_res_url, timeout=10)
-                    except Exception as e:
-                        image_bytes = None
-                        print(f"Unreachable URL: {highest_res_url}\n{str(e)}\n")
-
-                    image_path = out_dir + f'/{image_id}.jpg'
-
-                    if image_bytes:
-                        try:
-                            self._save_image_file(image_bytes, image_path)
-                        except Exception as e:
-                            print(f"Unsaveable image: {image_bytes}\n{str(e)}\n")
-                                
-                time.sleep(0.2) # Restricting API call frequency to be a good citizen
+                    yield {'url': highest_res_url,
+                           'path': out_dir + f'/{image_id}.jpg'}
             else:
                 print("Empty sizes dictionary, skipping.")
 
@@ -308,19 +721,31 @@ class FlickrCaller(APICaller):
         TODO: Generalize to other classes with params dict as input to supply.
         """        
         search_url = self._create_method_url('flickr.photos.search')
+        response = self.transport.get(search_url, params = self._search_params(query, page))
+        return response
+
+    def _search_params(self, query, page):
+        """Builds the request parameters of a photo search.
+
+        Args:
+            query (string): Image search query to search for.
+            page (int): The page index to start from.
+
+        Returns:
+            The parameter dict for flickr.photos.search.
+        """
         params = {  'api_key':self.key,
                     'text':query,
                     'tag_mode':'all',
                     'per_page':self.images_per_req,
-                    'page':str(page),
+                    'page':str(page + 1), # Flickr pages start at 1
                     'sort':'relevance',
                     'media':'photos',
                     'format':'json',
                     'nojsoncallback':1,
+                    'extras':','.join(['usage'] + [f'url_{suffix}' for suffix in FLICKR_SIZE_SUFFIXES]),
                 }
-        
-        response = requests.get(search_url, params = params)
-        return response
+        return params
 
     def get_image_sizes(self, image_id):
         """Queries the Flickr API for image formats of a given image ID.
@@ -329,7 +754,7 @@ class FlickrCaller(APICaller):
             image_id (string): The unique image identifier found in the API response.
         
         Returns:
-            A dict of all image formats.
+            The parsed response with a dict of all image formats, or None if it could not be retrieved.
         """        
         size_url = self._create_method_url('flickr.photos.getSizes')
         params = {  'api_key':self.key,
@@ -337,8 +762,13 @@ class FlickrCaller(APICaller):
                     'format':'json',
                     'nojsoncallback':1
                 }        
-        response = requests.get(size_url, params = params)
-        return response        
+
+        def request():
+            response = self.transport.get(size_url, params = params)
+            time.sleep(0.2) # Restricting API call frequency to be a good citizen
+            return response
+
+        return self._cached_request(f'getSizes {image_id}', 0, params, request)
 
     def _get_image_url(self, img_sizes, resolution = 7):
         """For a given stack of URLs, gets the specified resolution image.
@@ -363,6 +793,26 @@ class FlickrCaller(APICaller):
 
         return(highest_res_url)
 
+    def _get_extras_url(self, photo, resolution = 7):
+        """Gets the specified resolution image URL from the extras of a search result.
+
+        Mirrors _get_image_url: the available sizes are ordered like the getSizes nodes and the node
+        number is capped at the specified resolution.
+
+        Args:
+            photo (dict): A photo entry of a search response.
+            resolution (int): The resolution specified by the node. Lower values are lower resolutions.
+
+        Returns:
+            The image URL, or None if the search result lacks the URLs or the download permission.
+        """
+        if 'can_download' not in photo:
+            return None
+        urls = [photo[f'url_{suffix}'] for suffix in FLICKR_SIZE_SUFFIXES if photo.get(f'url_{suffix}')]
+        if not urls:
+            return None
+        return urls[min(len(urls) - 1, resolution)]
+
     def _create_method_url(self, method):
         """Appends the Flickr method to the Flickr API url.
 
@@ -387,10 +837,9 @@ def get_query_combinations(first_term, second_term):
     """        
     all_combinations = []
 
-    synonyms_1 = th.Word(first_term).synonyms()
-    syn1 = [first_term]+synonyms_1 # pre-prending original search terms
-    synonyms_2 = th.Word(second_term).synonyms()
-    syn2 = [second_term]+synonyms_2
+    word_1, word_2 = th.fetchWords([first_term, second_term]) # Looked up concurrently
+    syn1 = [first_term]+word_1.synonyms() # pre-prending original search terms
+    syn2 = [second_term]+word_2.synonyms()
 
     for s1 in syn1:
         for s2 in syn2:
@@ -415,4 +864,27 @@ def add_term_to_combinations(combinations, terms):
     for term in terms:
         for combo in combinations:
             combos.append(combo+[term])
-    return combos
\ No newline at end of file
+    return combos
+
+def weighted_synonyms(terms, min_relevance=1):
+    """Looks up the synonyms of terms and weights them by their thesaurus relevance.
+
+    The original terms get weight 1.0, synonyms a third of that per relevance level (3 is the most
+    relevant), so a QueryPlanner tries the original terms first.
+
+    Args:
+        terms (list of strings): Keywords to search synonyms for.
+        min_relevance (int): Lowest thesaurus relevance (1-3) of the synonyms to include.
+
+    Returns:
+        A term group per keyword: the keyword and its synonyms as (term, weight) tuples.
+    """
+    groups = []
+    for term, word in zip(terms, th.fetchWords(terms)): # Looked up concurrently
+        group = [(term, 1.0)]
+        definitions = word.filter(defnNum=0, filters={})
+        if definitions:
+            group += [(entry[0], entry[1] / 3 * 0.9) for entry in definitions[0]['syn']
+                      if entry[1] >= min_relevance]
+        groups.append(group)
+    return groups
@@ -0,0 +1,178 @@
+import os
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_km(lat, lon, lats, lons):
+    """Computes great-circle distances from one point to many.
+
+    Args:
+        lat (float): Latitude of the reference point in decimal degrees.
+        lon (float): Longitude of the reference point in decimal degrees.
+        lats (array): Latitudes of the other points.
+        lons (array): Longitudes of the other points.
+
+    Returns:
+        An array of distances in kilometres.
+    """
+    lat, lon, lats, lons = np.radians(lat), np.radians(lon), np.radians(lats), np.radians(lons)
+    a = np.sin((lats - lat) / 2) ** 2 + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+class GridIndex():
+    """On-disk grid index over image coordinates.
+
+    Points are bucketed in fixed-size latitude/longitude cells and stored sorted by cell. Cell IDs
+    are numbered row by row, so the cells of a bounding box form one contiguous ID range per grid
+    row, which is located with a binary search. Queries therefore only touch points in cells that
+    overlap the query area instead of scanning the whole corpus.
+    """
+    def __init__(self, paths, lats, lons, cell_size=0.1):
+        """
+        Args:
+            paths (array of strings): Image paths, one per point.
+            lats (array): Latitudes in decimal degrees, NaN for images without coordinates.
+            lons (array): Longitudes in decimal degrees, NaN for images without coordinates.
+            cell_size (float): Cell width and height in degrees.
+        """
+        self.cell_size = cell_size
+        self.cols = int(np.ceil(360 / cell_size))
+        self.rows = int(np.ceil(180 / cell_size))
+
+        lats, lons = np.asarray(lats, dtype=float), np.asarray(lons, dtype=float)
+        valid = ~(np.isnan(lats) | np.isnan(lons)) & (np.abs(lats) <= 90) & (np.abs(lons) <= 180)
+        cells = self._cell_ids(lats[valid], lons[valid])
+        order = np.argsort(cells, kind='stable')
+        self.cells = cells[order]
+        self.lats = lats[valid][order]
+        self.lons = lons[valid][order]
+        self.paths = np.asarray(paths, dtype=str)[valid][order]
+
+    @classmethod
+    def from_store(cls, exif_store, cell_size=0.1):
+        """Builds the index over all images with GPS data in an ExifStore.
+
+        Args:
+            exif_store (ExifStore): The metadata store.
+            cell_size (float): Cell width and height in degrees.
+
+        Returns:
+            The GridIndex.
+        """
+        lats, lons = exif_store.coordinates()
+        return cls(exif_store.columns['path'], lats, lons, cell_size)
+
+    @classmethod
+    def load(cls, index_path):
+        """Loads an index saved with save.
+
+        Args:
+            index_path (string): Path of the .npz index file.
+
+        Returns:
+            The GridIndex.
+        """
+        index = cls.__new__(cls)
+        with np.load(index_path, allow_pickle=False) as data:
+            index.cell_size = float(data['cell_size'])
+            index.cells, index.lats, index.lons, index.paths = data['cells'], data['lats'], data['lons'], data['paths']
+        index.cols = int(np.ceil(360 / index.cell_size))
+        index.rows = int(np.ceil(180 / index.cell_size))
+        return index
+
+    def save(self, index_path):
+        """Writes the index through a temporary file.
+
+        Args:
+            index_path (string): Path of the .npz index file.
+        """
+        tmp_path = f'{index_path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, cell_size=self.cell_size, cells=self.cells, lats=self.lats, lons=self.lons, paths=self.paths)
+        os.replace(tmp_path, index_path)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def _rows_cols(self, lats, lons):
+        rows = np.clip(((np.asarray(lats) + 90) // self.cell_size).astype(np.int64), 0, self.rows - 1)
+        cols = np.clip(((np.asarray(lons) + 180) // self.cell_size).astype(np.int64), 0, self.cols - 1)
+        return rows, cols
+
+    def _cell_ids(self, lats, lons):
+        rows, cols = self._rows_cols(lats, lons)
+        return rows * self.cols + cols
+
+    def _candidates(self, min_lat, min_lon, max_lat, max_lon):
+        """Gets the positions of the points in all cells overlapping a box that does not wrap around.
+
+        Returns:
+            An array of positions into the sorted point arrays.
+        """
+        (row0, row1), (col0, col1) = self._rows_cols([min_lat, max_lat], [min_lon, max_lon])
+        rows = np.arange(row0, row1 + 1)
+        starts = np.searchsorted(self.cells, rows * self.cols + col0, side='left')
+        ends = np.searchsorted(self.cells, rows * self.cols + col1, side='right')
+        if not len(starts) or not (ends - starts).any():
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([np.arange(start, end) for start, end in zip(starts, ends) if end > start])
+
+    def _box_positions(self, min_lat, min_lon, max_lat, max_lon):
+        """Gets the positions of the points inside a box, splitting boxes across the antimeridian."""
+        if min_lon > max_lon:
+            return np.concatenate([self._box_positions(min_lat, min_lon, max_lat, 180.0),
+                                   self._box_positions(min_lat, -180.0, max_lat, max_lon)])
+        candidates = self._candidates(min_lat, min_lon, max_lat, max_lon)
+        lats, lons = self.lats[candidates], self.lons[candidates]
+        inside = (lats >= min_lat) & (lats <= max_lat) & (lons >= min_lon) & (lons <= max_lon)
+        return candidates[inside]
+
+    def bbox(self, min_lat, min_lon, max_lat, max_lon):
+        """Finds the images inside a bounding box.
+
+        Args:
+            min_lat (float): Southern edge in decimal degrees.
+            min_lon (float): Western edge, may exceed max_lon for boxes across the antimeridian.
+            max_lat (float): Northern edge.
+            max_lon (float): Eastern edge.
+
+        Returns:
+            A list of (path, latitude, longitude) tuples.
+        """
+        positions = self._box_positions(min_lat, min_lon, max_lat, max_lon)
+        return list(zip(self.paths[positions].tolist(), self.lats[positions].tolist(), self.lons[positions].tolist()))
+
+    def radius(self, lat, lon, radius_km):
+        """Finds the images within a distance of a point, nearest first.
+
+        Args:
+            lat (float): Latitude of the centre in decimal degrees.
+            lon (float): Longitude of the centre in decimal degrees.
+            radius_km (float): Search radius in kilometres.
+
+        Returns:
+            A list of (path, latitude, longitude, distance in km) tuples.
+        """
+        dlat = np.degrees(radius_km / EARTH_RADIUS_KM)
+        min_lat, max_lat = max(lat - dlat, -90.0), min(lat + dlat, 90.0)
+        if min_lat <= -90 or max_lat >= 90: # The circle covers a pole, so every longitude
+            min_lon, max_lon = -180.0, 180.0
+        else:
+            dlon = np.degrees(np.arcsin(min(np.sin(radius_km / EARTH_RADIUS_KM) / np.cos(np.radians(lat)), 1.0)))
+            min_lon, max_lon = lon - dlon, lon + dlon
+            if dlon >= 180:
+                min_lon, max_lon = -180.0, 180.0
+            else:
+                min_lon = min_lon + 360 if min_lon < -180 else min_lon
+                max_lon = max_lon - 360 if max_lon > 180 else max_lon
+
+        positions = self._box_positions(min_lat, min_lon, max_lat, max_lon)
+        distances = haversine_km(lat, lon, self.lats[positions], self.lons[positions])
+        near = distances <= radius_km
+        positions, distances = positions[near], distances[near]
+        order = np.argsort(distances, kind='stable')
+        return list(zip(self.paths[positions[order]].tolist(), self.lats[positions[order]].tolist(),
+                        self.lons[positions[order]].tolist(), distances[order].tolist()))
@@ -1,7 +1,22 @@
+import copy
+import importlib.util
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import quote
+
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
+import soupsieve as sv
 from bs4 import BeautifulSoup
 from pprint import pprint
 
+# lxml is much faster than the pure-python html.parser
+PARSER = 'lxml' if importlib.util.find_spec('lxml') else 'html.parser'
+
 """
 I will do my best to come back and add better comments/docstrings to this file
 as quick as I can, but for now I think the README should suffice for your
@@ -21,22 +36,188 @@ def btw(inputString, lh, rh):
 def getFilter(keyName, filters):
     return filters['filters'][keyName] if keyName in filters['filters'] else None
 
+class OfflineCacheMiss(LookupError):
+    """Raised in offline mode when a word is not in the cache."""
+    pass
+
+# word data is cached in memory (LRU) and on disk (one json file per word).
+cacheOptions = {
+    'cacheDir': os.environ.get('THESAURUS_CACHE_DIR',
+                               os.path.join(os.path.expanduser('~'), '.cache', 'thesaurusScraper')),
+    'ttl': 30 * 24 * 3600,  # seconds before a disk entry is fetched again, None to never expire
+    'offline': False,       # only serve cached data, never hit thesaurus.com
+    'memorySize': 1024      # number of words kept in memory
+}
+_memoryCache = OrderedDict()
+_cacheLock = threading.Lock()
+_session = requests.Session()  # keeps connections to thesaurus.com alive between words
+requestTimeout = 10  # seconds, so a hung host can't block fetchWords forever
+
+def setCacheOptions(**options):
+    """change the cache settings, e.g. setCacheOptions(offline=True). a cacheDir
+    of None disables the disk cache.
+    """
+    for key in options:
+        if key not in cacheOptions:
+            raise KeyError('unknown cache option: {}'.format(key))
+    cacheOptions.update(options)
+    with _cacheLock:
+        while len(_memoryCache) > cacheOptions['memorySize']:
+            _memoryCache.popitem(last=False)
+
+def clearMemoryCache():
+    with _cacheLock:
+        _memoryCache.clear()
+
+def _cacheKey(inputWord):
+    return inputWord.strip().lower()
+
+def _cachePath(key):
+    return os.path.join(cacheOptions['cacheDir'], quote(key, safe='') + '.json')
+
+def _memoryGet(key):
+    with _cacheLock:
+        if key not in _memoryCache:
+            return None
+        _memoryCache.move_to_end(key)
+        return _memoryCache[key]
+
+def _memoryPut(key, defns):
+    with _cacheLock:
+        _memoryCache[key] = defns
+        _memoryCache.move_to_end(key)
+        while len(_memoryCache) > cacheOptions['memorySize']:
+            _memoryCache.popitem(last=False)
+
+def _diskGet(key):
+    if not cacheOptions['cacheDir']:
+        return None
+    try:
+        with open(_cachePath(key), 'r', encoding='utf-8') as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    ttl = cacheOptions['ttl']
+    expired = ttl is not None and time.time() - entry['fetched'] > ttl
+    if expired and not cacheOptions['offline']:
+        return None
+
+    # json turns our entry tuples into lists, so turn them back.
+    defns = entry['data']
+    for defn in defns:
+        for c in ['syn', 'ant']:
+            if c in defn:
+                defn[c] = [tuple(x) for x in defn[c]]
+    return defns
+
+def _diskPut(key, defns):
+    if not cacheOptions['cacheDir']:
+        return
+    os.makedirs(cacheOptions['cacheDir'], exist_ok=True)
+    path = _cachePath(key)
+    tmpPath = '{}.{}.tmp'.format(path, threading.get_ident())
+    with open(tmpPath, 'w', encoding='utf-8') as f:
+        json.dump({'fetched': time.time(), 'data': defns}, f)
+    os.replace(tmpPath, path)  # so a crash never leaves a half-written entry
+
 def fetchWordData(inputWord):
+    """returns the definitions of inputWord, from the cache if possible. raises
+    OfflineCacheMiss in offline mode if the word was never fetched before.
+    """
+    key = _cacheKey(inputWord)
+    defns = _memoryGet(key)
+    if defns is None:
+        defns = _diskGet(key)
+        if defns is None:
+            if cacheOptions['offline']:
+                raise OfflineCacheMiss('no cached data for "{}"'.format(inputWord))
+            defns = fetchRemoteWordData(inputWord)
+            _diskPut(key, defns)
+        _memoryPut(key, defns)
+
+    # Word pops the extra data off its list, so never hand out the cached one.
+    return copy.deepcopy(defns)
+
+def fetchRemoteWordData(inputWord):
+    """downloads and parses the definitions of inputWord. an unknown word (404)
+    has no definitions, any other error status raises requests.HTTPError, so
+    error pages never end up in the cache.
+    """
     url = formatWordUrl(inputWord)
-    r = requests.get(url)
-    soup = BeautifulSoup(r.content, 'html.parser')
+    r = _session.get(url, timeout=requestTimeout)
+    if r.status_code == 404:
+        return parseWordHtml(b'')
+    r.raise_for_status()
+    if r.status_code != 200:
+        raise requests.HTTPError('unexpected status {} for {}'.format(r.status_code, url), response=r)
+    return parseWordHtml(r.content)
+
+def fetchWordsData(inputWords, maxWorkers=8):
+    """fetch the data of many words at once. cached words are served right away,
+    the rest are downloaded concurrently over a shared keep-alive session.
+    returns a dict of word -> definitions, like fetchWordData returns them.
+    """
+    inputWords = list(OrderedDict.fromkeys(inputWords))  # drop duplicates, keep order
+    with ThreadPoolExecutor(max_workers=maxWorkers) as pool:
+        results = pool.map(fetchWordData, inputWords)
+        return OrderedDict(zip(inputWords, results))
+
+def fetchWords(inputWords, maxWorkers=8):
+    """same as fetchWordsData, but returns a Word object for every input word."""
+    inputWords = list(inputWords)
+    data = fetchWordsData(inputWords, maxWorkers)
+    return [Word(word, data=copy.deepcopy(data[word])) for word in inputWords]
+
+# compiled once; _allSel lets us collect everything in one pass over the page.
+_posSel = sv.compile('div.mask a.pos-tab')
+_synSel = sv.compile('div[id^="synonyms-"] li a')
+_originSel = sv.compile('div#word-origin div p')
+_exampleSel = sv.compile('div#example-sentences div p')
+_allSel = sv.compile(', '.join([_posSel.pattern, _synSel.pattern,
+                                _originSel.pattern, _exampleSel.pattern]))
+
+def _synonymsDivNum(tag):
+    # index of the closest div#synonyms-{n} around a link, None if it isn't a number.
+    for parent in tag.parents:
+        divId = parent.get('id', '') if parent.name == 'div' else ''
+        if divId.startswith('synonyms-'):
+            try:
+                return int(divId[len('synonyms-'):])
+            except ValueError:
+                continue
+    return None
+
+def parseWordHtml(content):
+    soup = BeautifulSoup(content, PARSER)
+
+    posTags = []
+    links = {}  # definition number -> its synonym/antonym links
+    origin = []
+    examples = []
+    clean = lambda x: x.strip().replace('\u201d', '"').replace('\u201c', '"')
 
-    definitionCount = len(soup.select("div.mask a.pos-tab"))
+    for x in _allSel.select(soup):
+        if _posSel.match(x):
+            posTags.append(x)
+        if _synSel.match(x):
+            n = _synonymsDivNum(x)
+            if n is not None:
+                links.setdefault(n, []).append(x)
+        if _originSel.match(x):
+            origin.append(clean(x.text))
+        if _exampleSel.match(x):
+            examples.append(clean(x.text))
+
+    definitionCount = len(posTags)
     defns = []
 
     # part of speech and meaning
-    posTags = soup.select("div.mask a.pos-tab")
     pos = [[z.text for z in x.select('em')][0] for x in posTags]
     meaning = [[z.text for z in x.select('strong')][0] for x in posTags]
 
     for defnNum in range(0, definitionCount):
-        wordPath = 'div#synonyms-{} li a'
-        data = soup.select(wordPath.format(defnNum))
+        data = links.get(defnNum, [])
 
         curr_def = {
             'partOfSpeech': pos[defnNum],
@@ -74,11 +255,8 @@ def fetchWordData(inputWord):
         defns.append(curr_def)
 
     # add origin and examples to the last element so we can .pop() it out later
-    clean = lambda x: x.strip().replace('\u201d', '"').replace('\u201c', '"')
-    origin = [clean(x.text) for x in soup.select("div#word-origin div p")]
-
     defns.append({
-    'examples': [clean(x.text) for x in soup.select("div#example-sentences div p")],
+    'examples': examples,
 
     # TODO: fix this, as there is a '...' that appears. Use span.oneClick-link
     'origin': origin[0] if len(origin) > 0 else ''
@@ -86,12 +264,42 @@ def fetchWordData(inputWord):
 
     return defns
 
+def _freeze(value):
+    # hashable version of a filter value, for memoizing filter() calls.
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(x) for x in value)
+    return value
+
+def _copyFiltered(fdata):
+    # filter() results are lists the caller may modify, never share them.
+    return [{c: list(entries) for c, entries in defn.items()} for defn in fdata]
+
 class Word:
-    def __init__(self, inputWord):
+    def __init__(self, inputWord, data=None):
         # in case you want to visit it later
         self.url = formatWordUrl(inputWord)
-        self.data = fetchWordData(inputWord)  # fetch the data from thesaurus.com
+        # fetch the data from thesaurus.com, unless it was fetched in bulk already
+        self.data = data if data is not None else fetchWordData(inputWord)
         self.extra = self.data.pop()
+        self._buildIndexes()
+
+    def _buildIndexes(self):
+        """index every entry by its attributes, so filter() can intersect sets
+        instead of checking each entry. self._indexes[defn][entry_type][attr]
+        maps an attribute value to the positions of the entries having it.
+        """
+        # tuple key is (word, relevance, length, complexity, form)
+        self._indexes = []
+        for defn in self.data:
+            defnIndex = {}
+            for entry_type in ['syn', 'ant']:
+                attrIndexes = [{} for _ in range(4)]
+                for pos, entry in enumerate(defn[entry_type]):
+                    for attr, value in enumerate(entry[1:5]):
+                        attrIndexes[attr].setdefault(value, set()).add(pos)
+                defnIndex[entry_type] = attrIndexes
+            self._indexes.append(defnIndex)
+        self._filterMemo = {}
 
     def __len__(self):
         # returns the number of definitions the word has
@@ -157,10 +365,19 @@ class Word:
 
             return fdata
 
-        # we're SOL. Time to do it the hard'n slow way.
+        # we're SOL. Time to do it the hard'n slow way, which the indexes make
+        # a lot less slow.
         optIdx = [i for i, x in enumerate(options) if x != [None]]
         options = [options[z] for z in optIdx]
 
+        try:
+            memoKey = (startRange, endRange, _freeze(partOfSpeech), _freeze(optIdx), _freeze(options))
+            hash(memoKey)
+        except TypeError:
+            memoKey = None  # unhashable filter values, can't memoize those.
+        if memoKey is not None and memoKey in self._filterMemo:
+            return _copyFiltered(self._filterMemo[memoKey])
+
         # tuple key is (word, relevance, length, complexity, form)
         for x in range(startRange, endRange):
             # iterate through definitions
@@ -171,24 +388,31 @@ class Word:
             c_entry = {'syn': [], 'ant': []}
 
             for entry_type in ['syn', 'ant']:
-                c_def = self.data[x]
-
-                for y in range(0, len(c_def[entry_type])):
-                    # iterate through synonym entries
-                    word = [c_def[entry_type][y][1:][yy] for yy in optIdx]
-                    z, zz = 0, len(word)
-                    looksGood = True
-
-                    while (looksGood == True) and (z < zz):
-                        opt = word[z]
-                        looksGood = True if opt in options[z] else False
-                        z += 1
-
-                    if looksGood == True:
-                        c_entry[entry_type].append(c_def[entry_type][y])
+                entries = self.data[x][entry_type]
+                matches = None
+
+                for attr, allowed in zip(optIdx, options):
+                    # entries having any of the allowed values for this attribute
+                    attrIndex = self._indexes[x][entry_type][attr]
+                    hits = set()
+                    for value in allowed:
+                        try:
+                            hits |= attrIndex.get(value, set())
+                        except TypeError:
+                            pass  # unhashable, so it can't equal any of our values.
+                    matches = hits if matches is None else matches & hits
+                    if not matches:
+                        break
+
+                if matches is None:
+                    c_entry[entry_type] = list(entries)
+                else:
+                    c_entry[entry_type] = [entries[y] for y in sorted(matches)]
 
             fdata.append(c_entry)
 
+        if memoKey is not None:
+            self._filterMemo[memoKey] = _copyFiltered(fdata)
         return fdata
 
 
@@ -0,0 +1,155 @@
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+FATAL_STATUS_CODES = {401, 403}
+
+
+def is_retryable(status_code):
+    """Checks whether a status code signals a transient failure worth retrying.
+
+    Args:
+        status_code (int): HTTP status code of a response.
+
+    Returns:
+        True if the request may succeed when repeated later.
+    """
+    return status_code in RETRYABLE_STATUS_CODES
+
+def is_fatal(status_code):
+    """Checks whether a status code means the provider will keep refusing our requests.
+
+    Args:
+        status_code (int): HTTP status code of a response.
+
+    Returns:
+        True if further calls with the same credentials are pointless.
+    """
+    return status_code in FATAL_STATUS_CODES
+
+def parse_retry_after(value):
+    """Parses a Retry-After header into a number of seconds to wait.
+
+    Args:
+        value (string): Header value, either delay-seconds or an HTTP date.
+
+    Returns:
+        The delay in seconds, or None if the header is missing or malformed.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class HttpTransport():
+    """Shared HTTP layer with pooled keep-alive connections and retries.
+
+    Connections are pooled per host by the underlying session, so repeated API calls and image
+    downloads from the same host skip the TCP and TLS handshakes. Retryable failures are repeated
+    with jittered exponential backoff; fatal and other client errors are returned immediately.
+    """
+    def __init__(self, max_retries=5, backoff_base=1.0, backoff_cap=60.0, max_retry_after=300.0,
+                 pool_connections=32, pool_maxsize=32):
+        """
+        Args:
+            max_retries (int): Number of retries after the first attempt.
+            backoff_base (float): Backoff in seconds before the first retry, doubled per attempt.
+            backoff_cap (float): Upper bound for a single backoff in seconds.
+            max_retry_after (float): Upper bound in seconds for honoring a server's Retry-After.
+            pool_connections (int): Number of hosts to keep connection pools for.
+            pool_maxsize (int): Number of kept-alive connections per host.
+        """
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.max_retry_after = max_retry_after
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get(self, url, max_retries=None, **kwargs):
+        """Performs a GET request, retrying transient failures.
+
+        Args:
+            url (string): The URL to request.
+            max_retries (int): Overrides the transport's retry count for this request.
+            **kwargs: Passed on to requests, e.g. params, headers and timeout.
+
+        Returns:
+            The final response. Its status code is non-200 if the retries were exhausted or the
+            error was not retryable.
+
+        Raises:
+            requests.RequestException: If the last attempt failed without a response.
+        """
+        kwargs.setdefault('timeout', 30)
+        if max_retries is None:
+            max_retries = self.max_retries
+        attempt = 0
+        while True:
+            try:
+                response = self.session.get(url, **kwargs)
+            except (requests.Timeout, requests.ConnectionError):
+                if attempt >= max_retries:
+                    raise
+                time.sleep(self._backoff(attempt))
+                attempt += 1
+                continue
+
+            if not is_retryable(response.status_code) or attempt >= max_retries:
+                return response
+
+            delay = parse_retry_after(response.headers.get('Retry-After'))
+            if delay is None:
+                delay = self._backoff(attempt)
+            else:
+                delay = min(delay, self.max_retry_after)
+            print(f"Status {response.status_code} for {url}, retrying in {delay:.1f}s")
+            response.close()
+            time.sleep(delay)
+            attempt += 1
+
+    def _backoff(self, attempt):
+        """Computes a full-jitter exponential backoff.
+
+        Args:
+            attempt (int): Zero-based index of the failed attempt.
+
+        Returns:
+            The number of seconds to sleep.
+        """
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+
+_default_transport = None
+_default_lock = threading.Lock()
+
+def get_default_transport():
+    """Returns the transport shared by all callers that were not given their own.
+
+    Returns:
+        The process-wide HttpTransport instance.
+    """
+    global _default_transport
+    with _default_lock:
+        if _default_transport is None:
+            _default_transport = HttpTransport()
+        return _default_transport
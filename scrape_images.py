@@ -6,63 +6,73 @@ Created on Mon Mar 19 11:04:33 2018
 @author: alex
 """
 
-from lib import scraper
 from lib.scraper import GoogleCaller, FlickrCaller, BingCaller
-
-def submit_query(api_caller, query, search_grouping, page):
-    """Submit a query to the specified target.
-
-    Args:
-        apicaller(APICaller): API class of the target.
-        query (string): Image search query to search for.
-        search_grouping (string): Folder grouping for search results.
-        page (int): The page index to start from.
-    """
-    api_caller.download_images(query, search_grouping = search_grouping, page = page)
+from lib.scheduler import QueryScheduler
+from lib.query_planner import QueryPlanner
+from lib.dedup_index import DedupIndex
+from lib.job_journal import JobJournal
+from lib.response_cache import ResponseCache
+from lib.metrics import get_default_metrics
+from lib.quota_budget import QuotaBudget, plan_pages
 
 if __name__ == '__main__':
 
 ## Build queries to automatically feed to APIs - Will result in many erratic searches, use as inspiration
-    # combinations = scraper.get_query_combinations("street","snow")
-    # extra_terms = ["city"] # Or add a list of synonyms, but this will create very many combinations
-    # combinations = scraper.add_term_to_combinations(combinations, extra_terms)
+    # term_groups = weighted_synonyms(["street","snow"]) # From lib.scraper, synonyms are weighted below the original terms
+    # term_groups.append(["city"]) # Or add a list of synonyms, the planner only yields what is asked for
 
     road_types = ['road','highway','street','route']
     # landcovers = ['forest','countryside','city','mountain']
-    # combinations = scraper.add_term_to_combinations([['car'],['lorry'],['motorcycle'],['highway']], ['crash', 'accident'])
-    combinations = scraper.add_term_to_combinations([['flooding on'],['submerged'], ['overflowed']], road_types)
+    # term_groups = [['car','lorry','motorcycle','highway'], ['crash', 'accident']]
+    term_groups = [['flooding on','submerged','overflowed'], road_types]
+    planner = QueryPlanner(term_groups, max_queries = 500)
 
     # Define search parameters
     DATA_ROOT = '/media/alex/A4A034E0A034BB1E/incidents-thesis/data'
     search_grouping = 'flooding'    
+    dedup_index = DedupIndex(f'{DATA_ROOT}/image_index.db') # Shared, so overlapping results are only stored once
+    journal = JobJournal(f'{DATA_ROOT}/{search_grouping}_journal.db', retry_failed = False) # Rerunning skips completed work
+    response_cache = ResponseCache(f'{DATA_ROOT}/response_cache.db', ttl = 7 * 24 * 3600)
+    REPLAY = False # Redrive image downloads from cached responses only, without API calls
+    budget = QuotaBudget(f'{DATA_ROOT}/quota_budget.db') # Counts calls across runs, set the limits of your plans
+    budget.set_limits('bing', monthly = 1000, per_second = 3)
+    budget.set_limits('flickr', daily = 3600 * 24, per_second = 1)
+    budget.set_limits('google', daily = 100, cost_per_call = 0.005) # Free tier, paid calls cost $5 per 1000
 
 ## Bing
     BING_API_KEY = u'' # From https://docs.microsoft.com/en-us/rest/api/cognitiveservices/bing-images-api-v7-reference 
-    bing = BingCaller(BING_API_KEY, DATA_ROOT, returns_per_req = 100)
+    bing = BingCaller(BING_API_KEY, DATA_ROOT, returns_per_req = 100, dedup_index = dedup_index, journal = journal,
+                      response_cache = response_cache, replay = REPLAY, budget = budget)
 
 ## Google
     GOOGLE_API_KEY = u'' # From https://console.developers.google.com
     CUSTOM_ENGINE = u'' # Create a custom search engine at https://cse.google.com
-    google = GoogleCaller(GOOGLE_API_KEY, DATA_ROOT, returns_per_req = 10, cx = CUSTOM_ENGINE)
+    google = GoogleCaller(GOOGLE_API_KEY, DATA_ROOT, returns_per_req = 10, cx = CUSTOM_ENGINE, dedup_index = dedup_index, journal = journal,
+                          response_cache = response_cache, replay = REPLAY, budget = budget)
 
 ## Flickr
     FLICKR_API_KEY = u'' # From https://www.flickr.com/services/apps/
-    flickr = FlickrCaller(FLICKR_API_KEY, DATA_ROOT, returns_per_req = 100)
+    flickr = FlickrCaller(FLICKR_API_KEY, DATA_ROOT, returns_per_req = 100, dedup_index = dedup_index, journal = journal,
+                          response_cache = response_cache, replay = REPLAY, budget = budget)
 
 ## Querying
-    for combination in combinations:
-        if all(status is not None for status in [bing.error_code, google.error_code, flickr.error_code]):
-            print("Errors exist in all API callers, cancelling search")
-            break
-
-        query = f"{combination[0]} {combination[1]}"
-
-        print(f"Querying for '{query}' using Bing")
-        submit_query(bing, query, search_grouping, page = 0)
-
-        print(f"Querying for '{query}' using Flickr")
-        submit_query(flickr, query, search_grouping, page = 0)
-
-        print(f"Querying for '{query}' using Google")
-        for i in range(10): # 10 imgs per call, max index is 100
-            submit_query(google, query, search_grouping, page = i)
\ No newline at end of file
+    pages = {'bing': 1, 'flickr': 1, 'google': 10} # Google returns 10 imgs per call, max index is 100
+    print(f"Estimated API calls: {planner.estimate_cost(pages)}")
+    weighted_queries = list(planner)
+    queries = [query for query, _ in weighted_queries]
+
+    scheduler = QueryScheduler(report_interval = 30)
+    for caller in [bing, flickr, google]:
+        # Spreads the calls left today over the best queries instead of running out halfway the list
+        plan = plan_pages(weighted_queries, budget.remaining(caller.source), pages[caller.source])
+        print(f"{caller.source}: {sum(plan.values())} search calls planned, usage {budget.usage(caller.source)}")
+        scheduler.add_provider(caller, pages = plan)
+    metrics = get_default_metrics() # Shared by all callers
+    metrics.start_periodic_export(interval = 60, json_path = f'{DATA_ROOT}/{search_grouping}_metrics.json',
+                                  prometheus_path = f'{DATA_ROOT}/{search_grouping}_metrics.prom')
+    try:
+        scheduler.run(queries, search_grouping)
+    finally:
+        metrics.stop_periodic_export()
+        journal.close()
+        budget.close()